@@ -0,0 +1,143 @@
+import hashlib
+import os
+import threading
+from datetime import datetime
+from functools import cache
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+
+# Keep-alive connections shared by every Google call of this process.
+_session = None
+_session_lock = threading.Lock()
+
+DRIVE_FIELDS = 'nextPageToken, files(id, name, mimeType, modifiedTime)'
+DRIVE_PAGE_SIZE = 1000
+DRIVE_MAX_PAGES = 20
+
+@cache
+def client_config():
+    """The OAuth client settings, read from the environment (and .env) once."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return {
+        'config': {
+            "web": {
+                "client_id": os.getenv("GOOGLE_CLIENT_ID"),
+                "client_secret": os.getenv("GOOGLE_CLIENT_SECRET"),
+                "redirect_uris": [os.getenv("GOOGLE_REDIRECT_URI")],
+                "auth_uri": settings.GOOGLE_AUTH_URI,
+                "token_uri": settings.GOOGLE_TOKEN_URI,
+            }
+        },
+        'scopes': os.getenv("GOOGLE_SCOPES", "").split(),
+        'redirect_uri': os.getenv("GOOGLE_REDIRECT_URI"),
+    }
+
+def flow(state=None):
+    """A fresh OAuth flow; it carries per-login state, the config does not."""
+    from google_auth_oauthlib.flow import Flow
+
+    config = client_config()
+    oauth_flow = Flow.from_client_config(config['config'], scopes=config['scopes'], state=state)
+    oauth_flow.redirect_uri = config['redirect_uri']
+    return oauth_flow
+
+def get_session():
+    """The pooled requests.Session, retrying connection errors and 429/5xx with backoff."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retry = Retry(total=settings.GOOGLE_HTTP_RETRIES, backoff_factor=0.5,
+                          status_forcelist=[429, 500, 502, 503, 504],
+                          allowed_methods=['GET', 'POST'])
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+def store_credentials(request, credentials):
+    request.session['credentials'] = {
+        'token': credentials.token,
+        'refresh_token': credentials.refresh_token,
+        'token_uri': credentials.token_uri,
+        'client_id': credentials.client_id,
+        'client_secret': credentials.client_secret,
+        'scopes': credentials.scopes,
+        'expiry': credentials.expiry.isoformat() if credentials.expiry else None,
+    }
+
+def load_credentials(request, force_refresh=False):
+    """
+    The signed-in user's credentials, refreshed through the pooled session
+    when the access token has expired (or force_refresh is set) and written
+    back to the session. None when nobody is signed in.
+    """
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
+    data = request.session.get('credentials')
+    if not data:
+        return None
+
+    credentials = Credentials(
+        token=data['token'],
+        refresh_token=data['refresh_token'],
+        token_uri=data['token_uri'],
+        client_id=data['client_id'],
+        client_secret=data['client_secret'],
+        scopes=data['scopes'],
+        expiry=datetime.fromisoformat(data['expiry']) if data.get('expiry') else None,
+    )
+    if (force_refresh or not credentials.valid) and credentials.refresh_token:
+        credentials.refresh(Request(session=get_session()))
+        store_credentials(request, credentials)
+    return credentials
+
+def authorized_get(request, url, params=None):
+    """GET a Google API as the signed-in user, refreshing the token once on a 401."""
+    credentials = load_credentials(request)
+    response = get_session().get(url, params=params, timeout=settings.GOOGLE_HTTP_TIMEOUT,
+                                 headers={'Authorization': f'Bearer {credentials.token}'})
+    if response.status_code == 401 and credentials.refresh_token:
+        credentials = load_credentials(request, force_refresh=True)
+        response = get_session().get(url, params=params, timeout=settings.GOOGLE_HTTP_TIMEOUT,
+                                     headers={'Authorization': f'Bearer {credentials.token}'})
+    response.raise_for_status()
+    return response.json()
+
+def _user_key(request):
+    data = request.session['credentials']
+    identity = data.get('refresh_token') or data['token']
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+def drive_files(request, refresh=False):
+    """
+    Every file of the signed-in user's Drive listing, following page tokens,
+    cached per user for GOOGLE_DRIVE_CACHE_SECONDS.
+    """
+    key = f'drive_files:{_user_key(request)}'
+    files = None if refresh else django_cache.get(key)
+    if files is not None:
+        return files
+
+    files, page_token = [], None
+    for _ in range(DRIVE_MAX_PAGES):
+        params = {'pageSize': DRIVE_PAGE_SIZE, 'fields': DRIVE_FIELDS}
+        if page_token:
+            params['pageToken'] = page_token
+        page = authorized_get(request, f'{settings.GOOGLE_API_BASE_URL}/drive/v3/files', params)
+        files.extend(page.get('files', []))
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            break
+
+    django_cache.set(key, files, settings.GOOGLE_DRIVE_CACHE_SECONDS)
+    return files
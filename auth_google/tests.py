@@ -1,3 +1,107 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+
+from .client import drive_files
+
+class StubGoogle(BaseHTTPRequestHandler):
+    """The token endpoint and a two-page Drive listing, recording every call on the server."""
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        self.server.calls.append(('token', form['grant_type'][0]))
+        self.server.issued += 1
+        self.server.valid_token = f'fresh-{self.server.issued}'
+        self.reply(200, {'access_token': self.server.valid_token, 'expires_in': 3600})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        page_token = parse_qs(url.query).get('pageToken', [None])[0]
+        self.server.calls.append(('files', page_token))
+        if self.headers['Authorization'] != f'Bearer {self.server.valid_token}':
+            self.reply(401, {'error': 'invalid_token'})
+        elif page_token is None:
+            self.reply(200, {'files': [{'id': '1', 'name': 'july.csv'}], 'nextPageToken': 'page-2'})
+        else:
+            self.reply(200, {'files': [{'id': '2', 'name': 'august.xlsx'}]})
+
+class DriveFilesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGoogle)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{cls.server.server_port}'
+        cls.stub_settings = override_settings(GOOGLE_TOKEN_URI=f'{base_url}/token', GOOGLE_API_BASE_URL=base_url)
+        cls.stub_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub_settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.calls = []
+        self.server.issued = 0
+        self.server.valid_token = 'current'
+
+    def signed_in(self, token='current', expiry=None):
+        request = RequestFactory().get('/')
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        request.session['credentials'] = {
+            'token': token,
+            'refresh_token': 'refresh',
+            'token_uri': settings.GOOGLE_TOKEN_URI,
+            'client_id': 'client',
+            'client_secret': 'secret',
+            'scopes': ['https://www.googleapis.com/auth/drive.readonly'],
+            'expiry': expiry,
+        }
+        return request
+
+    def test_pages_are_followed(self):
+        files = drive_files(self.signed_in())
+        self.assertEqual([f['name'] for f in files], ['july.csv', 'august.xlsx'])
+        self.assertEqual(self.server.calls, [('files', None), ('files', 'page-2')])
+
+    def test_expired_token_is_refreshed_before_the_call(self):
+        request = self.signed_in(expiry=datetime(2000, 1, 1).isoformat())
+        drive_files(request)
+        self.assertEqual(self.server.calls[0], ('token', 'refresh_token'))
+        self.assertEqual(request.session['credentials']['token'], 'fresh-1')
+        self.assertEqual(len(self.server.calls), 3)
+
+    def test_rejected_token_is_refreshed_once(self):
+        request = self.signed_in(token='revoked')
+        files = drive_files(request)
+        self.assertEqual(len(files), 2)
+        self.assertEqual(self.server.calls[:3], [('files', None), ('token', 'refresh_token'), ('files', None)])
+        self.assertEqual(request.session['credentials']['token'], 'fresh-1')
+
+    def test_listing_is_cached(self):
+        drive_files(self.signed_in())
+        self.assertEqual(len(drive_files(self.signed_in())), 2)
+        self.assertEqual(len(self.server.calls), 2)
+
+        drive_files(self.signed_in(), refresh=True)
+        self.assertEqual(len(self.server.calls), 4)
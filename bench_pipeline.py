@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark the upload -> scan -> compare -> download pipeline end to end on
+synthetic Meesho supplier panel exports, through the Django test client:
+
+    python bench_pipeline.py [rows ...] [--scan-ratio 0.1] [--output baseline.json]
+                             [--baseline previous.json]
+
+Rows default to 1,000 10,000 and 100,000; pass 1000000 for the large run.
+Every step records wall time and its peak traced allocation (tracemalloc,
+which covers pandas/numpy buffers but slows the run a little). The results
+are written as JSON; given --baseline, each step is also printed against
+the same step of an earlier run. Runs use a throwaway database and media
+directory, and build reports inside the compare request so it is timed.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'return_mgm.settings')
+
+import django
+django.setup()
+
+import pandas as pd
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+
+from core.models import ReturnBatch
+from synthetic_exports import scan_set, write_export
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        response = fn()
+        if getattr(response, 'streaming', False):
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+    finally:
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    if response.status_code >= 400:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    return response, {'seconds': round(seconds, 4), 'peak_mb': round(peak / 2 ** 20, 2), 'bytes': size}
+
+def run_size(client, workdir, rows, ratio):
+    path = os.path.join(workdir, f'export_{rows}.csv')
+    awbs = write_export(path, rows)
+    scans = scan_set(awbs, ratio)
+    steps = {}
+
+    with open(path, 'rb') as f:
+        _, steps['upload'] = measure(lambda: client.post('/upload/', {'files': f}))
+    batch = ReturnBatch.objects.order_by('-id').first()
+
+    _, steps['save_scan'] = measure(lambda: client.post(
+        f'/batch/{batch.id}/save-scan/', {'scanned_data': ','.join(scans)}))
+
+    _, steps['compare'] = measure(lambda: client.get(f'/batch/{batch.id}/compare/'))
+    for kind in ('matched', 'unmatched'):
+        url = f'/batch/{batch.id}/download-{kind}/'
+        _, steps[f'download_{kind}_xlsx'] = measure(lambda: client.get(url))
+        _, steps[f'download_{kind}_csv'] = measure(lambda: client.get(url, {'format': 'csv'}))
+
+    os.remove(path)
+    return {'rows': rows, 'scans': len(scans), 'steps': steps}
+
+def print_results(results, baseline=None):
+    for size, result in results['sizes'].items():
+        print(f"\n📦 {int(size):,} rows, {result['scans']:,} scans")
+        previous = (baseline or {}).get('sizes', {}).get(size, {}).get('steps', {})
+        for step, stats in result['steps'].items():
+            line = f"   {step:<24} {stats['seconds']:9.3f}s {stats['peak_mb']:9.1f} MB peak"
+            if step in previous and previous[step]['seconds']:
+                line += f"   {stats['seconds'] / previous[step]['seconds']:6.2f}x time"
+                line += f" {stats['peak_mb'] / max(previous[step]['peak_mb'], 0.01):6.2f}x memory"
+            print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('rows', nargs='*', type=int, default=[1_000, 10_000, 100_000])
+    parser.add_argument('--scan-ratio', type=float, default=0.1)
+    parser.add_argument('--output', default='bench_baseline.json')
+    parser.add_argument('--baseline')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    setup_test_environment()
+    settings.MEDIA_ROOT = os.path.join(workdir, 'media')
+    settings.ALLOWED_HOSTS = ['*']
+    settings.REPORT_JOB_WORKERS = 0
+    settings.DEBUG = False
+    connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+    results = {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'pandas': pd.__version__,
+        'scan_ratio': args.scan_ratio,
+        'sizes': {},
+    }
+    try:
+        client = Client()
+        for rows in args.rows:
+            print(f"🧪 Benchmarking {rows:,} rows...")
+            results['sizes'][str(rows)] = run_size(client, workdir, rows, args.scan_ratio)
+    finally:
+        connection.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    results['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Results written to {args.output}")
@@ -3,8 +3,21 @@ from django import forms
 class MultipleFileInput(forms.ClearableFileInput):
     allow_multiple_selected = True
 
+class MultipleFileField(forms.FileField):
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(d, initial) for d in data]
+        return [single_file_clean(data, initial)]
+
 class UploadFileForm(forms.Form):
-    files = forms.FileField(
-        widget=MultipleFileInput(attrs={'multiple': True}),
+    files = MultipleFileField(
+        widget=MultipleFileInput(attrs={'multiple': True, 'accept': '.csv, .xlsx', 'class': 'form-control'}),
         label="Select one or more files"
     )
+
+class PodZipForm(forms.Form):
+    archive = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={'accept': '.zip', 'class': 'form-control'}),
+        label="ZIP of proof-of-delivery PDFs"
+    )
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .indexing import CLASSIFY_CHUNK
+from .metrics import span
+from .models import ScannedAWB
+
+# Every AWB ever scanned, across batches, for spotting parcels returned twice.
+# A store is a directory under media/history of flat arrays, named by
+# current.json along with the id of the last scan it covers:
+#   hashes.u64   64-bit AWB hashes, sorted
+#   batches.u32  the batch each hash was scanned in, alongside
+#   bloom.u8     a Bloom filter over the hashes
+# Later scans are read from the database until the store is merged again.
+CURRENT_FILE = 'current.json'
+HASH_FILE = 'hashes.u64'
+BATCH_FILE = 'batches.u32'
+BLOOM_FILE = 'bloom.u8'
+MERGE_LOCK_FILE = 'merge.lock'
+MERGE_LOCK_STALE = 600
+
+# ~1% false positives
+BLOOM_BITS_PER_AWB = 10
+BLOOM_HASHES = 7
+BUILD_CHUNK = 100_000
+# Times get_history re-reads current.json after losing a race with a merge
+OPEN_RETRIES = 3
+
+_store = None
+_store_lock = threading.Lock()
+
+def history_dir():
+    return os.path.join(settings.MEDIA_ROOT, 'history')
+
+def awb_hash(awb):
+    return int.from_bytes(hashlib.blake2b(awb.encode(), digest_size=8).digest(), 'little')
+
+def awb_hashes(awbs):
+    import numpy as np
+
+    return np.fromiter((awb_hash(awb) for awb in awbs), dtype=np.uint64, count=len(awbs))
+
+class BloomFilter:
+    """
+    Bloom filter over 64-bit hashes, its bits in a uint8 array (memory-mapped
+    when loaded). The k probe positions come from the hash's two halves by
+    double hashing, so no AWB is hashed twice.
+    """
+    def __init__(self, bits, hashes=BLOOM_HASHES):
+        self.bits = bits
+        self.size = len(bits) * 8
+        self.hashes = hashes
+
+    @classmethod
+    def build(cls, hashes, size):
+        import numpy as np
+
+        bloom = cls(np.zeros(max(size // 8, 1), dtype=np.uint8))
+        for i in range(0, len(hashes), BUILD_CHUNK):
+            positions = bloom._positions(hashes[i:i + BUILD_CHUNK]).ravel()
+            np.bitwise_or.at(bloom.bits, positions >> 3, np.left_shift(1, positions & 7).astype(np.uint8))
+        return bloom
+
+    def _positions(self, hashes):
+        import numpy as np
+
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        probes = np.arange(self.hashes, dtype=np.uint64)
+        return (low[:, None] + probes * high[:, None]) % np.uint64(self.size)
+
+    def might_contain(self, hashes):
+        """Per hash: False if certainly absent, True if probably present."""
+        import numpy as np
+
+        if not len(hashes):
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(hashes)
+        return ((self.bits[positions >> 3] >> (positions & 7)) & 1).astype(bool).all(axis=1)
+
+class AwbHistory:
+    """
+    Every AWB scanned up to `last_scan_id`, with the batches it was scanned
+    in. The arrays are memory-mapped, so only the pages a lookup touches are
+    read: a Bloom filter probe, then a binary search for the rare hits.
+    """
+    def __init__(self, path, meta):
+        import numpy as np
+
+        self.path = path
+        self.name = meta['dir']
+        self.last_scan_id = meta['last_scan_id']
+        self.count = meta['count']
+        directory = os.path.join(path, meta['dir'])
+        if self.count:
+            self.hashes = np.memmap(os.path.join(directory, HASH_FILE), dtype=np.uint64, mode='r')
+            self.batches = np.memmap(os.path.join(directory, BATCH_FILE), dtype=np.uint32, mode='r')
+            self.bloom = BloomFilter(np.memmap(os.path.join(directory, BLOOM_FILE), dtype=np.uint8, mode='r'),
+                                     meta['bloom_hashes'])
+
+    def lookup(self, hashes):
+        """{position in `hashes`: set of batch ids} for the hashes on record."""
+        import numpy as np
+
+        if not self.count or not len(hashes):
+            return {}
+        candidates = np.flatnonzero(self.bloom.might_contain(hashes))
+        left = np.searchsorted(self.hashes, hashes[candidates], side='left')
+        right = np.searchsorted(self.hashes, hashes[candidates], side='right')
+        return {int(i): set(self.batches[lo:hi].tolist())
+                for i, lo, hi in zip(candidates, left, right) if hi > lo}
+
+    def merged(self, min_new=0, wait=False):
+        """
+        A store that also covers the scans recorded since this one, written
+        next to it and made current. Returns self if fewer than `min_new`
+        scans are new, or if another process is merging and `wait` is false.
+        """
+        import numpy as np
+
+        new = ScannedAWB.objects.filter(id__gt=self.last_scan_id)
+        if min_new and new.count() < min_new:
+            return self
+
+        with merge_lock(self.path, wait) as locked:
+            if not locked:
+                return self
+            last_scan_id, hashes, batches = read_scans(new)
+            if last_scan_id is None:
+                return self
+            if self.count:
+                hashes = np.concatenate([np.asarray(self.hashes), hashes])
+                batches = np.concatenate([np.asarray(self.batches), batches])
+            return write_history(self.path, hashes, batches, last_scan_id)
+
+@contextmanager
+def merge_lock(path, wait=False):
+    """
+    Hold the history directory's merge lock across processes, yielding
+    whether it was taken. A lock left behind by a crashed merge expires
+    after MERGE_LOCK_STALE seconds.
+    """
+    lock_path = os.path.join(path, MERGE_LOCK_FILE)
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > MERGE_LOCK_STALE:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if not wait:
+                yield False
+                return
+            time.sleep(0.1)
+    try:
+        yield True
+    finally:
+        os.remove(lock_path)
+
+def read_scans(scans):
+    """(last id, hashes, batch ids) of a ScannedAWB queryset; the id is None if it is empty."""
+    import numpy as np
+
+    ids, batch_ids, awbs = [], [], []
+    for scan_id, batch_id, awb in scans.order_by('id').values_list('id', 'batch_id', 'awb_number') \
+            .iterator(chunk_size=BUILD_CHUNK):
+        ids.append(scan_id)
+        batch_ids.append(batch_id)
+        awbs.append(awb)
+    return (ids[-1] if ids else None), awb_hashes(awbs), np.array(batch_ids, dtype=np.uint32)
+
+def write_history(path, hashes, batches, last_scan_id):
+    """
+    Sort and store (hash, batch) pairs as a new version and point current.json
+    at it. Callers hold the merge lock.
+    """
+    import numpy as np
+
+    order = np.lexsort((batches, hashes))
+    hashes, batches = hashes[order], batches[order]
+    if len(hashes):
+        keep = np.ones(len(hashes), dtype=bool)
+        keep[1:] = (hashes[1:] != hashes[:-1]) | (batches[1:] != batches[:-1])
+        hashes, batches = hashes[keep], batches[keep]
+
+    name = f'v{last_scan_id}-{uuid.uuid4().hex[:8]}'
+    directory = os.path.join(path, name)
+    os.makedirs(directory)
+    hashes.tofile(os.path.join(directory, HASH_FILE))
+    batches.tofile(os.path.join(directory, BATCH_FILE))
+    BloomFilter.build(hashes, len(hashes) * BLOOM_BITS_PER_AWB).bits.tofile(os.path.join(directory, BLOOM_FILE))
+
+    meta = {'dir': name, 'count': len(hashes), 'last_scan_id': last_scan_id, 'bloom_hashes': BLOOM_HASHES}
+    tmp_path = os.path.join(path, f'{CURRENT_FILE}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, CURRENT_FILE))
+
+    # Processes that still have an old version mapped keep reading their open files
+    for entry in os.scandir(path):
+        if entry.is_dir() and entry.name != name:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    return AwbHistory(path, meta)
+
+def build_history():
+    """Rebuild the store from the scans in the database alone; returns it."""
+    global _store
+    path = history_dir()
+    os.makedirs(path, exist_ok=True)
+    with _store_lock, merge_lock(path, wait=True):
+        last_scan_id, hashes, batches = read_scans(ScannedAWB.objects.all())
+        _store = write_history(path, hashes, batches, last_scan_id or 0)
+        return _store
+
+def get_history():
+    """
+    The current store, reopened when another process has replaced it and
+    merged once AWB_HISTORY_MERGE_SCANS scans have come in since. The first
+    call builds it from every scan on record, as does one that keeps finding
+    the version current.json names gone.
+    """
+    global _store
+    path = history_dir()
+    for _ in range(OPEN_RETRIES):
+        try:
+            with open(os.path.join(path, CURRENT_FILE)) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return build_history()
+
+        try:
+            with _store_lock:
+                if _store is None or _store.path != path or _store.name != meta['dir']:
+                    _store = AwbHistory(path, meta)
+                _store = _store.merged(min_new=settings.AWB_HISTORY_MERGE_SCANS)
+                return _store
+        except FileNotFoundError:
+            # Another process merged and removed this version after current.json was read
+            continue
+    return build_history()
+
+def merge_history():
+    """Fold every scan recorded so far into the store, e.g. before batches are pruned."""
+    global _store
+    store = get_history()
+    with _store_lock:
+        _store = store.merged(wait=True)
+        return _store
+
+def repeat_batches(batch, awbs):
+    """
+    {AWB: ids of the other batches it was scanned in} for the AWBs in `awbs`
+    that were returned before: the store, plus the scans it does not cover
+    yet. Batches pruned since still count.
+    """
+    awbs = list(dict.fromkeys(awbs))
+    if not awbs:
+        return {}
+
+    store = get_history()
+    found = defaultdict(set)
+    with span('history'):
+        for i, batch_ids in store.lookup(awb_hashes(awbs)).items():
+            found[awbs[i]] |= batch_ids
+
+    # At most AWB_HISTORY_MERGE_SCANS rows; a long list is checked against all of them
+    recent = ScannedAWB.objects.filter(id__gt=store.last_scan_id).exclude(batch=batch)
+    if len(awbs) > CLASSIFY_CHUNK:
+        wanted = set(awbs)
+        pairs = ((batch_id, awb) for batch_id, awb in recent.values_list('batch_id', 'awb_number') if awb in wanted)
+    else:
+        pairs = recent.filter(awb_number__in=awbs).values_list('batch_id', 'awb_number')
+    for batch_id, awb in pairs:
+        found[awb].add(batch_id)
+
+    repeats = {awb: sorted(batch_ids - {batch.pk}) for awb, batch_ids in found.items()}
+    return {awb: batch_ids for awb, batch_ids in repeats.items() if batch_ids}
@@ -0,0 +1,394 @@
+import multiprocessing
+import os
+import re
+from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Q
+from django.utils import timezone
+
+from .ingest import UnreadableUpload, is_csv, iter_csv_rows, iter_upload_chunks, read_errors, sniff_csv
+from .metrics import span, timed
+from .models import ReturnBatch, ReturnRollup, ScannedAWB, UploadedRow
+
+INDEX_BATCH_SIZE = 2000
+# AWBs per IN (...) lookup while classifying, under SQLite's parameter limit
+CLASSIFY_CHUNK = 900
+# Up to this many rollup groups are found through the group index rather than read in full
+ROLLUP_LOOKUP_GROUPS = 100
+
+# Export column -> UploadedRow field, for everything indexed besides the AWB
+ROW_FIELDS = {
+    'Order Number': 'order_number',
+    'Suborder Number': 'suborder_number',
+    'Courier Partner': 'courier_partner',
+    'SKU': 'sku',
+    'Type of Return': 'return_type',
+    'Return Reason': 'return_reason',
+    'Delivered Date': 'delivered_date',
+}
+DATE_FORMATS = ['%d-%m-%y', '%d-%m-%Y', '%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y']
+
+# CSVs up to this size are indexed with the csv module, without loading pandas
+SMALL_CSV_BYTES = 1024 * 1024
+# Uploads smaller than this in total are parsed in-process: spawning workers
+# that each run django.setup and import pandas takes about two seconds, the
+# time it takes to parse some 30 MB of export
+PARSE_POOL_MIN_BYTES = 64 * 1024 * 1024
+
+# Tried in order; the first pattern that matches anywhere in the link wins.
+TRACKING_PATTERNS = [
+    re.compile(r'trackingId=([A-Z0-9]+)'),
+    re.compile(r'refNum=([A-Z0-9]+)'),
+    re.compile(r'trackid=([0-9]+)'),
+    re.compile(r'/([A-Z0-9]{10,})$'),
+    re.compile(r'/package/([0-9]+)'),
+]
+
+# Excel and pandas turn long numeric AWBs into floats: 1.73E+17, 173...0.0
+SCIENTIFIC_AWB = re.compile(r'\d+(?:\.\d+)?E\+\d+')
+FLOAT_AWB = re.compile(r'(\d+)\.0+')
+AWB_NOISE = re.compile(r'[\s-]+')
+
+def extract_awb_from_url(url):
+    if not isinstance(url, str):
+        return ''
+    for pattern in TRACKING_PATTERNS:
+        m = pattern.search(url)
+        if m:
+            return m.group(1)
+    return url.strip()
+
+def extract_awbs(links):
+    """
+    extract_awb_from_url over a whole column in one pass. See bench_extract.py
+    for why this beats both Series.apply and a combined str.extract pattern.
+    """
+    import pandas as pd
+
+    return pd.Series([extract_awb_from_url(url) for url in links.tolist()],
+                     index=links.index, dtype=object)
+
+def normalize_awb(value):
+    """
+    Canonical form of an AWB, applied the same way to uploaded rows and to
+    scans: the AWB out of a tracking link, upper case, no spaces or dashes,
+    float renderings turned back into digits, no leading zeros.
+    """
+    if not isinstance(value, str):
+        return ''
+    value = value.strip()
+    if '/' in value or '=' in value:
+        value = extract_awb_from_url(value)
+    value = AWB_NOISE.sub('', value.upper())
+
+    if SCIENTIFIC_AWB.fullmatch(value):
+        value = str(int(Decimal(value)))
+    else:
+        m = FLOAT_AWB.fullmatch(value)
+        if m:
+            value = m.group(1)
+    return value.lstrip('0') or value[-1:]
+
+def normalize_awbs(values):
+    """normalize_awb over a column; tracking links go through extract_awb_from_url."""
+    import pandas as pd
+
+    return pd.Series([normalize_awb(value) for value in values.tolist()],
+                     index=values.index, dtype=object)
+
+def parse_day(value):
+    """The date part of an export date cell such as '21-07-25' or '21-07-25 9:38'."""
+    value = value.split(' ')[0] if isinstance(value, str) else ''
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def row_values(values):
+    """ROW_FIELDS values of one row, in order, with the delivery date parsed."""
+    *values, delivered = values
+    return (*values, parse_day(delivered))
+
+def awb_column(columns):
+    """The column AWBs are taken from, preferring the tracking link."""
+    if 'Tracking Link' in columns:
+        return 'Tracking Link'
+    if 'AWB Number' in columns:
+        return 'AWB Number'
+    return None
+
+def chunk_awbs(chunk, column):
+    values = chunk[column]
+    if column == 'Tracking Link':
+        with span('extract'):
+            values = extract_awbs(values)
+    with span('normalize'):
+        return normalize_awbs(values)
+
+def parse_upload_index(path):
+    """
+    Stream a stored file, reading only the matching columns, and return
+    (AWB column, row count, records), each record being (row number, AWB,
+    *ROW_FIELDS values). Touches no database, so it can run in a worker
+    process. Raises UnreadableUpload for a file that is not a CSV or workbook.
+    """
+    try:
+        if is_csv(path) and os.path.getsize(path) <= SMALL_CSV_BYTES:
+            return parse_small_csv_index(path)
+        return parse_upload_chunks(path)
+    except read_errors() as exc:
+        raise UnreadableUpload(f'not a readable CSV or Excel workbook ({type(exc).__name__}: {exc})') from exc
+
+def parse_upload_chunks(path):
+    """parse_upload_index for a file read a DataFrame chunk at a time."""
+    column, row_count, records = None, 0, []
+    for chunk in timed(iter_upload_chunks(path), 'parse'):
+        column = awb_column(chunk.columns)
+        row_count += len(chunk)
+        if column is None:
+            continue
+
+        fields = chunk.reindex(columns=list(ROW_FIELDS)).astype(object).fillna('')
+        records.extend((row, awb, *row_values(values)) for row, awb, values in
+                       zip(chunk.index.tolist(), chunk_awbs(chunk, column), fields.values.tolist()))
+
+    return column, row_count, records
+
+def parse_small_csv_index(path):
+    """parse_upload_index for a small CSV, row by row with no DataFrames."""
+    column = awb_column(sniff_csv(path).columns)
+    if column is None:
+        return None, sum(1 for _ in iter_csv_rows(path, [])), []
+
+    records = []
+    with span('parse'):
+        for row, (value, *values) in iter_csv_rows(path, [column, *ROW_FIELDS]):
+            records.append((row, normalize_awb(value), *row_values(values)))
+    return column, len(records), records
+
+@transaction.atomic
+def save_upload_index(upload, parsed):
+    """Persist a parsed AWB -> row index so that comparisons never touch the file."""
+    column, row_count, records = parsed
+    with span('index'):
+        upload.rows.all().delete()
+        UploadedRow.objects.bulk_create(
+            (UploadedRow(upload=upload, row_number=row, awb_number=awb, **dict(zip(ROW_FIELDS.values(), values)))
+             for row, awb, *values in records),
+            batch_size=INDEX_BATCH_SIZE,
+        )
+
+    upload.awb_column = column or ''
+    upload.row_count = row_count
+    upload.indexed_at = timezone.now()
+    upload.save(update_fields=['awb_column', 'row_count', 'indexed_at'])
+
+def build_upload_index(upload):
+    with reading(upload):
+        parsed = parse_upload_index(upload.file.path)
+    save_upload_index(upload, parsed)
+
+@contextmanager
+def reading(upload):
+    """Name the upload in an UnreadableUpload raised while it is parsed."""
+    try:
+        yield
+    except UnreadableUpload as exc:
+        raise UnreadableUpload(f'{upload.file_name}: {exc}') from exc
+
+def build_upload_indexes(uploads):
+    """
+    Index several uploads at once, parsing the files concurrently in a
+    process pool when they are large enough to pay for starting it, and
+    saving each index from this process.
+    """
+    if len(uploads) <= 1 or settings.UPLOAD_PARSE_WORKERS <= 1 \
+            or sum(os.path.getsize(u.file.path) for u in uploads) < PARSE_POOL_MIN_BYTES:
+        for upload in uploads:
+            build_upload_index(upload)
+        return
+
+    workers = min(len(uploads), settings.UPLOAD_PARSE_WORKERS)
+    # Spawned, not forked: this runs on a thread of a multi-threaded server,
+    # and a child forked while another thread holds a lock can deadlock
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=django.setup) as pool:
+        # The workers' read, extract and normalize time all shows up as parse
+        parsed_files = timed(pool.map(parse_upload_index, [u.file.path for u in uploads]), 'parse')
+        for upload in uploads:
+            with reading(upload):
+                parsed = next(parsed_files)
+            save_upload_index(upload, parsed)
+
+@span('match')
+def classify_batch(batch):
+    """
+    Fold the uploads and scans added to a batch since the last call into its
+    stored classification and return the batch with fresh counts. Only the
+    new uploads' rows and the new scans are looked at, so a compare after a
+    few dozen scans costs a few dozen index lookups. Uploads are claimed and
+    scans matched under a lock on the batch, so concurrent callers never
+    count a parcel or a scan twice.
+
+    Counts are also kept per ReturnRollup group, a parcel falling in the
+    group of its first row: first by when its upload was classified, then by
+    upload and row id.
+    """
+    classified = batch.classified_uploads.values_list('id', flat=True)
+    if batch.uploads.exclude(id__in=classified).exists():
+        _classify_uploads(batch)
+
+    pending = batch.scans.filter(matched__isnull=True)
+    last = pending.aggregate(last=Max('id'))['last']
+    if last is not None:
+        pending = pending.filter(id__lte=last)
+        order = {upload_id: n for n, upload_id in enumerate(
+            ReturnBatch.classified_uploads.through.objects.filter(returnbatch=batch)
+            .order_by('id').values_list('uploadedfile_id', flat=True))}
+        awbs = list(pending.values_list('awb_number', flat=True))
+        rows = []
+        for i in range(0, len(awbs), CLASSIFY_CHUNK):
+            chunk = UploadedRow.objects.filter(upload__in=list(order), awb_number__in=awbs[i:i + CLASSIFY_CHUNK])
+            # Unordered, or SQLite walks the row-number index to avoid a sort
+            rows.extend(chunk.values('id', 'upload', 'awb_number', *ReturnRollup.DIMENSIONS).order_by())
+        rows.sort(key=lambda row: (order[row['upload']], row['upload'], row['id']))
+        _match_scans(batch, pending.filter(matched__isnull=True), rows)
+        pending.filter(matched__isnull=True).update(matched=False)
+
+    batch.refresh_from_db(fields=['parcel_count', 'matched_count'])
+    return batch
+
+def _classify_uploads(batch):
+    """
+    Count the parcels of the batch's unclassified uploads and match the
+    scans waiting on them. Each upload is claimed first, in the same
+    transaction, so an upload two callers find new is counted by one.
+    """
+    with transaction.atomic():
+        _lock_batch(batch)
+        new = sorted(batch.uploads.exclude(id__in=batch.classified_uploads.values('id')).values_list('id', flat=True))
+        new = [upload_id for upload_id in new if _claim_upload(batch, upload_id)]
+        if not new:
+            return
+        classified = list(ReturnBatch.classified_uploads.through.objects.filter(returnbatch=batch)
+                          .exclude(uploadedfile__in=new).values_list('uploadedfile_id', flat=True))
+
+        rows = UploadedRow.objects.filter(upload__in=new)
+        # An AWB already listed in an earlier file (or earlier in these) is the same parcel
+        listed = UploadedRow.objects.filter(awb_number=OuterRef('awb_number')).filter(
+            Q(upload__in=classified)
+            | Q(upload__in=new, upload__lt=OuterRef('upload'))
+            | Q(upload=OuterRef('upload'), id__lt=OuterRef('id')))
+        firsts = rows.filter(Q(awb_number='') | ~Exists(listed))
+        parcels = {_group_key(group): group['n'] for group in
+                   firsts.values(*ReturnRollup.DIMENSIONS).annotate(n=Count('id')).order_by()}
+        _add_to_rollups(batch, 'parcels', parcels)
+        ReturnBatch.objects.filter(pk=batch.pk).update(parcel_count=F('parcel_count') + sum(parcels.values()))
+
+        # Scans of AWBs nobody had listed so far; their first row is in these uploads
+        unmatched = batch.scans.filter(matched=False)
+        _match_scans(batch, unmatched, firsts.filter(awb_number__in=unmatched.values('awb_number'))
+                     .values('awb_number', *ReturnRollup.DIMENSIONS).order_by())
+
+def _claim_upload(batch, upload_id):
+    """Mark an upload classified for the batch; False if another caller already has."""
+    try:
+        with transaction.atomic():
+            ReturnBatch.classified_uploads.through.objects.create(returnbatch=batch, uploadedfile_id=upload_id)
+    except IntegrityError:
+        return False
+    return True
+
+def _group_key(values):
+    return tuple(values[dimension] for dimension in ReturnRollup.DIMENSIONS)
+
+def _lock_batch(batch):
+    """
+    Serialize classification of a batch inside a transaction: a row lock
+    where the database has them, while on SQLite the IMMEDIATE transaction
+    already holds the write lock.
+    """
+    ReturnBatch.objects.select_for_update().filter(pk=batch.pk).values_list('pk').get()
+
+def _match_scans(batch, scans, rows):
+    """
+    Mark `scans` whose AWB appears in `rows` matched, counting each into the
+    group of the first row listing its AWB. The scans are read once and
+    flipped by id, a chunk per update; they are read under the batch lock,
+    so the counts come from exactly the scans flipped.
+    """
+    first_rows = {}
+    for row in rows:
+        first_rows.setdefault(row['awb_number'], row)
+    if not first_rows:
+        return
+
+    matched = defaultdict(int)
+    with transaction.atomic():
+        _lock_batch(batch)
+        flipped = [(scan_id, awb) for scan_id, awb in scans.values_list('id', 'awb_number').order_by()
+                   if awb in first_rows]
+        ids = [scan_id for scan_id, _ in flipped]
+        for i in range(0, len(ids), CLASSIFY_CHUNK):
+            ScannedAWB.objects.filter(id__in=ids[i:i + CLASSIFY_CHUNK]).update(matched=True)
+        for _, awb in flipped:
+            matched[_group_key(first_rows[awb])] += 1
+        _add_to_rollups(batch, 'matched', matched)
+        ReturnBatch.objects.filter(pk=batch.pk).update(matched_count=F('matched_count') + sum(matched.values()))
+
+def _rollup_ids(batch, keys):
+    """
+    {group key: rollup id} for those of `keys` the batch has a rollup for:
+    an index lookup when there are a few, else one read of them all.
+    """
+    rollups = batch.rollups.all()
+    if len(keys) <= ROLLUP_LOOKUP_GROUPS:
+        # Every combination of the values involved, narrowed down below
+        for i, dimension in enumerate(ReturnRollup.DIMENSIONS):
+            values = {key[i] for key in keys}
+            lookup = Q(**{f'{dimension}__in': values - {None}})
+            if None in values:
+                lookup |= Q(**{f'{dimension}__isnull': True})
+            rollups = rollups.filter(lookup)
+    keys = set(keys)
+    existing = ((_group_key(rollup), rollup['id']) for rollup in rollups.values('id', *ReturnRollup.DIMENSIONS))
+    return {key: rollup_id for key, rollup_id in existing if key in keys}
+
+def _add_to_rollups(batch, field, counts):
+    """
+    Add {group key: n} to `field` of the batch's rollups: missing groups are
+    created in one insert and existing ones moved by F() updates, one per
+    distinct n.
+    """
+    counts = {key: n for key, n in counts.items() if n}
+    existing = _rollup_ids(batch, counts)
+    missing = [key for key in counts if key not in existing]
+    if missing:
+        try:
+            with transaction.atomic():
+                ReturnRollup.objects.bulk_create(
+                    ReturnRollup(batch=batch, **dict(zip(ReturnRollup.DIMENSIONS, key)), **{field: counts[key]})
+                    for key in missing)
+        except IntegrityError:
+            # Another caller created some of them in the meantime
+            for key in missing:
+                ReturnRollup.objects.get_or_create(batch=batch, **dict(zip(ReturnRollup.DIMENSIONS, key)))
+            existing = _rollup_ids(batch, counts)
+        else:
+            counts = {key: n for key, n in counts.items() if key in existing}
+
+    by_count = defaultdict(list)
+    for key, n in counts.items():
+        by_count[n].append(existing[key])
+    for n, ids in by_count.items():
+        for i in range(0, len(ids), CLASSIFY_CHUNK):
+            ReturnRollup.objects.filter(id__in=ids[i:i + CLASSIFY_CHUNK]).update(**{field: F(field) + n})
@@ -0,0 +1,207 @@
+import csv
+import hashlib
+import io
+import itertools
+import os
+import uuid
+import zipfile
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+
+# The only columns matching needs; everything else stays in the stored file.
+MATCH_COLUMNS = ['AWB Number', 'Tracking Link', 'Courier Partner', 'Order Number', 'Suborder Number',
+                 'SKU', 'Type of Return', 'Return Reason', 'Delivered Date']
+
+CHUNK_ROWS = 10000
+
+# Supplier panel exports put a few lines of account details above the real
+# header, which is the first row naming one of these columns.
+HEADER_MARKERS = {'AWB Number', 'Tracking Link'}
+SNIFF_BYTES = 8192
+SNIFF_ROWS = 30
+
+# Every column is read as text, so IDs such as Order Number keep all their
+# digits and "NA" stays a value. These few repeat across thousands of rows
+# and are held as categories instead.
+CATEGORY_COLUMNS = {'Courier Partner', 'Type of Return', 'Sub Type', 'Return Price Type', 'Return Reason'}
+COLUMN_DTYPES = defaultdict(lambda: str, {column: 'category' for column in CATEGORY_COLUMNS})
+
+Layout = namedtuple('Layout', 'header_row columns')
+
+class UnreadableUpload(ValueError):
+    """A stored upload that is not a CSV or Excel workbook that can be read."""
+
+def read_errors():
+    """What the CSV and workbook readers raise on a malformed or mislabelled file."""
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    return ValueError, KeyError, csv.Error, zipfile.BadZipFile, InvalidFileException
+
+# (first line, supplier id) -> Layout of the last file seen with that preamble.
+_layout_cache = {}
+LAYOUT_CACHE_SIZE = 256
+
+def store_upload(file):
+    """
+    Write an uploaded file under media/uploads in a single pass over its
+    chunks, hashing it on the way. Returns (relative path, sha256 hex digest).
+    """
+    upload_path = os.path.join(settings.MEDIA_ROOT, 'uploads')
+    os.makedirs(upload_path, exist_ok=True)
+
+    unique_name = f"{uuid.uuid4()}_{file.name}"
+    digest = hashlib.sha256()
+    with open(os.path.join(upload_path, unique_name), 'wb+') as dest:
+        for chunk in file.chunks():
+            digest.update(chunk)
+            dest.write(chunk)
+
+    return os.path.join('uploads', unique_name), digest.hexdigest()
+
+def is_csv(path):
+    return os.path.splitext(path)[1].lower() == '.csv'
+
+def _find_header(rows):
+    for i, row in enumerate(rows):
+        cells = [('' if cell is None else str(cell)).strip() for cell in row]
+        if HEADER_MARKERS.intersection(cells):
+            return Layout(i, cells)
+    return None
+
+def _signature(rows):
+    if not rows:
+        return None
+    supplier = next((row[1] for row in rows[:SNIFF_ROWS]
+                     if len(row) > 1 and row[0] == 'Supplier ID'), '')
+    return (','.join(rows[0]), supplier)
+
+def sniff_csv(path):
+    """
+    Locate the header row of a CSV from its first few KB only. Layouts are
+    cached per preamble signature and re-checked against the header line, so
+    repeat exports from one supplier skip the scan.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    lines = head.decode('utf-8-sig', errors='replace').splitlines()
+    if len(head) == SNIFF_BYTES:
+        lines = lines[:-1]  # the last line may be cut short
+    rows = list(csv.reader(io.StringIO('\n'.join(lines[:SNIFF_ROWS]))))
+
+    key = _signature(rows)
+    cached = _layout_cache.get(key)
+    if cached and cached.header_row < len(rows) and \
+            [c.strip() for c in rows[cached.header_row]] == cached.columns:
+        return cached
+
+    layout = _find_header(rows) or Layout(0, [c.strip() for c in rows[0]] if rows else [])
+    if key is not None:
+        if len(_layout_cache) >= LAYOUT_CACHE_SIZE:
+            _layout_cache.pop(next(iter(_layout_cache)))
+        _layout_cache[key] = layout
+    return layout
+
+def _strip_column(col):
+    if col.dtype.name == 'category':
+        # Strip the few categories, not every cell
+        stripped = col.cat.categories.str.strip()
+        if stripped.is_unique:
+            return col.cat.rename_categories(stripped)
+        return col.astype(object).str.strip().astype('category')
+    return col.str.strip()
+
+def _strip(df):
+    return df.apply(_strip_column)
+
+def _cell(value):
+    """Text of a worksheet cell; whole-number floats lose their '.0', never digits."""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def _iter_csv(path, columns, chunksize, nrows, offset):
+    import pandas as pd
+
+    layout = sniff_csv(path)
+    header = layout.header_row
+    usecols = None if columns is None else [c for c in layout.columns if c in columns]
+    skiprows = header if not offset else (lambda i: i < header or header < i <= header + offset)
+    reader = pd.read_csv(path, skiprows=skiprows, dtype=COLUMN_DTYPES, usecols=usecols,
+                         keep_default_na=False, chunksize=chunksize, nrows=nrows)
+    with reader:
+        for chunk in reader:
+            chunk.index += offset
+            yield _strip(chunk)
+
+def _iter_xlsx(path, columns, chunksize, nrows, offset):
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        head = []
+        for row in rows:
+            head.append(row)
+            if _find_header([row]) or len(head) == SNIFF_ROWS:
+                break
+        if not head:
+            return
+        layout = _find_header(head) or Layout(0, [('' if c is None else str(c)).strip() for c in head[0]])
+        rows = itertools.chain(head[layout.header_row + 1:], rows)
+        rows = itertools.islice(rows, offset, None if nrows is None else offset + nrows)
+        keep = [i for i, name in enumerate(layout.columns) if columns is None or name in columns]
+        names = [layout.columns[i] for i in keep]
+
+        start = offset
+        while True:
+            buffer = [['' if i >= len(row) else _cell(row[i]) for i in keep]
+                      for row in itertools.islice(rows, chunksize)]
+            if buffer or start == offset:
+                df = pd.DataFrame(buffer, columns=names, index=range(start, start + len(buffer)))
+                yield _strip(df.astype({name: COLUMN_DTYPES[name] for name in names}))
+            if len(buffer) < chunksize:
+                break
+            start += len(buffer)
+    finally:
+        wb.close()
+
+def iter_csv_rows(path, columns):
+    """
+    The pandas-free reader for small CSVs: yield (row number, values) for
+    each data row, values being the stripped cells of `columns` in order
+    ('' when absent). Row numbers match iter_upload_chunks: like pandas, this
+    skips lines that are empty or only whitespace, but keeps rows of empty
+    cells such as ',,'.
+    """
+    layout = sniff_csv(path)
+    positions = [layout.columns.index(c) if c in layout.columns else None for c in columns]
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = csv.reader(f)
+        for _ in itertools.islice(rows, layout.header_row + 1):
+            pass
+        number = 0
+        for row in rows:
+            if len(row) <= 1 and not ''.join(row).strip():
+                continue
+            yield number, [row[i].strip() if i is not None and i < len(row) else '' for i in positions]
+            number += 1
+
+def iter_upload_chunks(path, columns=MATCH_COLUMNS, chunksize=CHUNK_ROWS, nrows=None, offset=0):
+    """
+    Stream a stored upload as DataFrames of at most `chunksize` rows, every
+    cell stripped text ('' when empty, CATEGORY_COLUMNS as categoricals) and
+    the index the row number within the file. Pass columns=None to read
+    every column.
+    """
+    if is_csv(path):
+        return _iter_csv(path, columns, chunksize, nrows, offset)
+    return _iter_xlsx(path, columns, chunksize, nrows, offset)
+
+def read_upload(path, columns=None, nrows=None, offset=0):
+    import pandas as pd
+
+    return pd.concat(list(iter_upload_chunks(path, columns=columns, nrows=nrows, offset=offset)))
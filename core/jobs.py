@@ -0,0 +1,85 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .indexing import classify_batch
+from .metrics import collect
+from .models import ReportJob
+from .reports import cached_report, report_version
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.REPORT_JOB_WORKERS,
+                                           thread_name_prefix='report-job')
+        return _executor
+
+def run_report_job(job_id):
+    """Count matches and build both cached workbooks for a job's batch."""
+    with collect() as spans:
+        _run_report_job(job_id)
+    logger.info("Report job %s built in %s", job_id,
+                ', '.join(f'{stage} {seconds * 1000:.0f} ms' for stage, seconds in spans.items()))
+
+def _run_report_job(job_id):
+    ReportJob.objects.filter(pk=job_id).update(status=ReportJob.RUNNING)
+    job = ReportJob.objects.select_related('batch').get(pk=job_id)
+    batch = job.batch
+    try:
+        classify_batch(batch)
+        job.matched_count = batch.matched_count
+        job.unmatched_count = batch.unmatched_count
+        cached_report(batch, matched=True)
+        cached_report(batch, matched=False)
+        job.status = ReportJob.DONE
+    except Exception as exc:
+        logger.exception("Report job %s for batch %s failed", job.pk, batch.pk)
+        job.status = ReportJob.FAILED
+        job.error = str(exc)
+    job.finished_at = timezone.now()
+    job.save()
+
+def _run_in_worker(job_id):
+    try:
+        run_report_job(job_id)
+    finally:
+        connection.close()
+
+def fail_stale_jobs(jobs):
+    """Fail the jobs among `jobs` still queued or running past REPORT_JOB_TIMEOUT_MINUTES."""
+    cutoff = timezone.now() - timedelta(minutes=settings.REPORT_JOB_TIMEOUT_MINUTES)
+    return jobs.filter(status__in=ReportJob.ACTIVE, created_at__lt=cutoff).update(
+        status=ReportJob.FAILED, error='No worker finished this job; reload to start a new one.',
+        finished_at=timezone.now())
+
+def enqueue_report_job(batch):
+    """
+    Queue report generation for a classified batch, reusing a job for the same report
+    version that is queued, running or already done. A job whose worker went
+    away is failed first, so it is replaced rather than waited on forever.
+    With REPORT_JOB_WORKERS = 0 the job runs inline.
+    """
+    version = report_version(batch)
+    fail_stale_jobs(batch.jobs.all())
+    job = batch.jobs.filter(version=version).exclude(status=ReportJob.FAILED).order_by('-id').first()
+    if job is not None:
+        return job
+
+    job = ReportJob.objects.create(batch=batch, version=version)
+    if settings.REPORT_JOB_WORKERS:
+        get_executor().submit(_run_in_worker, job.pk)
+    else:
+        run_report_job(job.pk)
+        job.refresh_from_db()
+    return job
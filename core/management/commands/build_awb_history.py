@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.history import build_history, merge_history
+
+class Command(BaseCommand):
+    help = 'Merge scans recorded since the last merge into the AWB history used to flag repeat returns.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild from the scans in the database; forgets batches pruned since.')
+
+    def handle(self, *args, **options):
+        store = build_history() if options['full'] else merge_history()
+        self.stdout.write(f"AWB history holds {store.count} entries, up to scan {store.last_scan_id}.")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.storage import prune_batches, prune_scan_syncs, prune_uploads
+
+class Command(BaseCommand):
+    help = ('Delete uploads no batch uses and stray upload files older than UPLOAD_RETENTION_DAYS, '
+            'scanner retry answers older than SCAN_SYNC_RETENTION_DAYS, and batches idle for '
+            'BATCH_RETENTION_DAYS if that is set.')
+
+    def handle(self, *args, **options):
+        batches = prune_batches()
+        uploads, files = prune_uploads()
+        syncs = prune_scan_syncs()
+        self.stdout.write(f"Pruned {batches} batch(es), {uploads} upload(s), {files} stray file(s) "
+                          f"and {syncs} scan sync(s).")
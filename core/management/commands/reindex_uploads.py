@@ -0,0 +1,38 @@
+import os
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.indexing import build_upload_index
+from core.models import ReportJob, ReturnBatch, ReturnRollup, ScannedAWB, UploadedFile
+
+class Command(BaseCommand):
+    help = ('Rebuild the row index of stored uploads from their files with the current parsing and AWB '
+            'normalization, then reset every batch so it is reclassified on its next compare.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true',
+                            help='Only index uploads that have no indexed rows yet.')
+
+    def handle(self, *args, **options):
+        uploads = UploadedFile.objects.order_by('id')
+        if options['missing']:
+            uploads = uploads.filter(rows__isnull=True)
+
+        indexed = 0
+        for upload in uploads:
+            try:
+                build_upload_index(upload)
+            except (OSError, ValueError) as exc:
+                self.stderr.write(f"Skipped {upload.file_name}: {exc}")
+                continue
+            indexed += 1
+
+        ScannedAWB.objects.update(matched=None)
+        ReturnBatch.classified_uploads.through.objects.all().delete()
+        ReturnBatch.objects.update(parcel_count=0, matched_count=0)
+        ReturnRollup.objects.all().delete()
+        ReportJob.objects.all().delete()
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, 'reports'), ignore_errors=True)
+        self.stdout.write(f"Indexed {indexed} upload(s); batches are reclassified on their next compare.")
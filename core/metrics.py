@@ -0,0 +1,111 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Seconds; a compare of a large export can take a minute.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Histogram:
+    """A Prometheus histogram held in this process, keyed by label values."""
+    def __init__(self, name, help_text, labels, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            index = bisect.bisect_left(self.buckets, seconds)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, (list(counts), total, count))
+                            for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            labels = ','.join(f'{label}="{value}"' for label, value in zip(self.labels, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+REQUEST_SECONDS = Histogram('returns_request_seconds', 'Time to produce a response, by view.',
+                            ['view', 'method', 'status'])
+STAGE_SECONDS = Histogram('returns_stage_seconds', 'Time spent in a pipeline stage per request or job.',
+                          ['stage'])
+
+# Stage name -> seconds so far, for the request or job being collected.
+_spans = ContextVar('spans', default=None)
+
+def record(stage, seconds):
+    spans = _spans.get()
+    if spans is None:
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    else:
+        spans[stage] = spans.get(stage, 0.0) + seconds
+
+@contextmanager
+def span(stage):
+    """Time a block as part of `stage`; repeated spans of one stage add up."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+def timed(iterable, stage):
+    """
+    Yield from `iterable`, counting the time spent producing items as one
+    `stage` span, recorded once the iteration ends or is abandoned. An
+    abandoned generator is closed along with it.
+    """
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        if hasattr(iterator, 'close'):
+            iterator.close()
+        record(stage, elapsed)
+
+@contextmanager
+def collect():
+    """
+    Gather the spans of one request or job, yielding {stage: seconds}. Each
+    stage's total goes into STAGE_SECONDS once the block ends, or into the
+    enclosing collection when nested (a job run inside a request).
+    """
+    spans = {}
+    token = _spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _spans.reset(token)
+        for stage, seconds in spans.items():
+            record(stage, seconds)
+
+def render():
+    """Every metric of this process in the Prometheus text exposition format."""
+    return '\n'.join(REQUEST_SECONDS.render() + STAGE_SECONDS.render()) + '\n'
@@ -0,0 +1,51 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import REQUEST_SECONDS, collect
+
+logger = logging.getLogger(__name__)
+
+class TimingMiddleware:
+    """
+    Time every request and the pipeline spans inside it. The spans are sent
+    back as a Server-Timing header and, like the total, fed to /metrics.
+    Spans of a streamed body happen after the headers and only reach /metrics.
+    Works in both stacks, so that under ASGI async views stay on the loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with collect() as spans:
+            response = self.get_response(request)
+        return self.finish(request, response, spans, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with collect() as spans:
+            response = await self.get_response(request)
+        return self.finish(request, response, spans, time.perf_counter() - start)
+
+    def finish(self, request, response, spans, elapsed):
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, view=view, method=request.method, status=response.status_code)
+
+        timings = [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in spans.items()]
+        response['Server-Timing'] = ', '.join(timings + [f'total;dur={elapsed * 1000:.1f}'])
+
+        log = logger.warning if elapsed >= settings.SLOW_REQUEST_SECONDS else logger.debug
+        log("%s %s -> %s in %.0f ms (%s)", request.method, request.path, response.status_code,
+            elapsed * 1000, ', '.join(f'{stage} {seconds * 1000:.0f} ms' for stage, seconds in spans.items()))
+        return response
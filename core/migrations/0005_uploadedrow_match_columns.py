@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_uploadedfile_index_uploadedrow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedrow',
+            name='courier_partner',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='uploadedrow',
+            name='order_number',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='uploadedrow',
+            name='suborder_number',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
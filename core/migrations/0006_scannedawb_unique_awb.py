@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:30
+
+import os
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def dedupe_and_import_scans(apps, schema_editor):
+    """
+    Drop duplicate scans so the unique index can be built, then carry over
+    AWBs saved by the old media/scanned_awbs.txt store.
+    """
+    ScannedAWB = apps.get_model('core', 'ScannedAWB')
+
+    seen = set()
+    for pk, awb in ScannedAWB.objects.order_by('scanned_at', 'id').values_list('id', 'awb_number'):
+        if awb in seen:
+            ScannedAWB.objects.filter(pk=pk).delete()
+        seen.add(awb)
+
+    txt_path = os.path.join(settings.MEDIA_ROOT, 'scanned_awbs.txt')
+    if os.path.exists(txt_path):
+        with open(txt_path, 'r') as f:
+            legacy = {line.strip() for line in f if line.strip()}
+        ScannedAWB.objects.bulk_create(
+            [ScannedAWB(awb_number=awb) for awb in legacy - seen],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_uploadedrow_match_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_and_import_scans, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='scannedawb',
+            name='awb_number',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+    ]
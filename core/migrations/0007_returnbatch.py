@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:05
+
+import os
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def assign_batches(apps, schema_editor):
+    """
+    Give every existing upload its own batch and hand the global scan set
+    to the newest one, which is what compare used to check it against.
+    """
+    UploadedFile = apps.get_model('core', 'UploadedFile')
+    ReturnBatch = apps.get_model('core', 'ReturnBatch')
+    ScannedAWB = apps.get_model('core', 'ScannedAWB')
+
+    latest = None
+    for upload in UploadedFile.objects.order_by('uploaded_at', 'id'):
+        latest = ReturnBatch.objects.create(name=upload.file_name or os.path.basename(upload.file.name))
+        latest.uploads.add(upload)
+
+    if latest is None and ScannedAWB.objects.exists():
+        latest = ReturnBatch.objects.create(name='Imported scans')
+    ScannedAWB.objects.update(batch=latest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_scannedawb_unique_awb'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReturnBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('uploads', models.ManyToManyField(related_name='batches', to='core.uploadedfile')),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='scannedawb',
+            name='batch',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='scans', to='core.returnbatch'),
+        ),
+        migrations.RunPython(assign_batches, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='scannedawb',
+            name='batch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scans', to='core.returnbatch'),
+        ),
+        migrations.AlterField(
+            model_name='scannedawb',
+            name='awb_number',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='scannedawb',
+            constraint=models.UniqueConstraint(fields=('batch', 'awb_number'), name='scannedawb_unique_per_batch'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:12
+
+import hashlib
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def hash_uploads(apps, schema_editor):
+    """
+    Hash the stored files of existing uploads and fold repeat uploads of the
+    same content into the oldest one. The files of the folded records are
+    left for prune_uploads to remove.
+    """
+    UploadedFile = apps.get_model('core', 'UploadedFile')
+
+    kept = {}
+    for upload in UploadedFile.objects.order_by('uploaded_at', 'id'):
+        upload.last_used_at = upload.uploaded_at
+        try:
+            digest = hashlib.sha256()
+            with upload.file.open('rb'):
+                for chunk in upload.file.chunks():
+                    digest.update(chunk)
+            upload.content_hash = digest.hexdigest()
+        except (OSError, ValueError):
+            upload.save(update_fields=['last_used_at'])
+            continue
+
+        original = kept.setdefault(upload.content_hash, upload)
+        if original is upload:
+            upload.save(update_fields=['content_hash', 'last_used_at'])
+            continue
+
+        for batch in upload.batches.all():
+            batch.uploads.add(original)
+        original.last_used_at = upload.uploaded_at
+        original.save(update_fields=['last_used_at'])
+        upload.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='last_used_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(hash_uploads, migrations.RunPython.noop),
+    ]
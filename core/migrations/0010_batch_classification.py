@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_uploadedfile_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='returnbatch',
+            name='classified_uploads',
+            field=models.ManyToManyField(blank=True, related_name='+', to='core.uploadedfile'),
+        ),
+        migrations.AddField(
+            model_name='returnbatch',
+            name='matched_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='returnbatch',
+            name='parcel_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scannedawb',
+            name='matched',
+            field=models.BooleanField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='scannedawb',
+            index=models.Index(fields=['batch', 'matched'], name='scannedawb_matched_idx'),
+        ),
+    ]
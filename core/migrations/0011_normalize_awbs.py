@@ -0,0 +1,104 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:20
+
+import os
+import re
+import shutil
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+# normalize_awb as it stood when this migration was written, so later
+# changes to core.indexing do not change what it does
+TRACKING_PATTERNS = [
+    re.compile(r'trackingId=([A-Z0-9]+)'),
+    re.compile(r'refNum=([A-Z0-9]+)'),
+    re.compile(r'trackid=([0-9]+)'),
+    re.compile(r'/([A-Z0-9]{10,})$'),
+    re.compile(r'/package/([0-9]+)'),
+]
+SCIENTIFIC_AWB = re.compile(r'\d+(?:\.\d+)?E\+\d+')
+FLOAT_AWB = re.compile(r'(\d+)\.0+')
+AWB_NOISE = re.compile(r'[\s-]+')
+
+
+def extract_awb_from_url(url):
+    for pattern in TRACKING_PATTERNS:
+        m = pattern.search(url)
+        if m:
+            return m.group(1)
+    return url.strip()
+
+
+def normalize_awb(value):
+    if not isinstance(value, str):
+        return ''
+    value = value.strip()
+    if '/' in value or '=' in value:
+        value = extract_awb_from_url(value)
+    value = AWB_NOISE.sub('', value.upper())
+
+    if SCIENTIFIC_AWB.fullmatch(value):
+        value = str(int(Decimal(value)))
+    else:
+        m = FLOAT_AWB.fullmatch(value)
+        if m:
+            value = m.group(1)
+    return value.lstrip('0') or value[-1:]
+
+
+def normalize(apps, schema_editor):
+    """
+    Rewrite stored AWBs in normalized form, merging scans that collapse onto
+    the same AWB, and reset every batch's classification and report cache so
+    they are rebuilt against the new values. Uploads stored before rows were
+    indexed are left to `manage.py reindex_uploads --missing`, which parses
+    files with the code of the day.
+    """
+    UploadedRow = apps.get_model('core', 'UploadedRow')
+    ScannedAWB = apps.get_model('core', 'ScannedAWB')
+    ReturnBatch = apps.get_model('core', 'ReturnBatch')
+    ReportJob = apps.get_model('core', 'ReportJob')
+
+    changed = []
+    for row in UploadedRow.objects.only('id', 'awb_number').iterator(chunk_size=BATCH_SIZE):
+        awb = normalize_awb(row.awb_number)
+        if awb != row.awb_number:
+            row.awb_number = awb
+            changed.append(row)
+    UploadedRow.objects.bulk_update(changed, ['awb_number'], batch_size=BATCH_SIZE)
+
+    kept, changed, duplicates = set(), [], []
+    for scan in ScannedAWB.objects.order_by('id').iterator(chunk_size=BATCH_SIZE):
+        awb = normalize_awb(scan.awb_number)
+        if not awb or (scan.batch_id, awb) in kept:
+            duplicates.append(scan.id)
+            continue
+        kept.add((scan.batch_id, awb))
+        if awb != scan.awb_number:
+            scan.awb_number = awb
+            changed.append(scan)
+    ScannedAWB.objects.filter(id__in=duplicates).delete()
+    # Park renamed scans on their ids first so no rename hits a not yet renamed one
+    for scan in changed:
+        ScannedAWB.objects.filter(id=scan.id).update(awb_number=f'#{scan.id}')
+    ScannedAWB.objects.bulk_update(changed, ['awb_number'], batch_size=BATCH_SIZE)
+
+    ScannedAWB.objects.update(matched=None)
+    ReturnBatch.classified_uploads.through.objects.all().delete()
+    ReturnBatch.objects.update(parcel_count=0, matched_count=0)
+    ReportJob.objects.all().delete()
+    shutil.rmtree(os.path.join(settings.MEDIA_ROOT, 'reports'), ignore_errors=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_batch_classification'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize, migrations.RunPython.noop),
+    ]
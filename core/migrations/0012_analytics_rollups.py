@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def reset_classification(apps, schema_editor):
+    """
+    Reset every batch's classification, so its rollups are built on the next
+    compare. The new row fields of uploads stored before this migration are
+    left blank here: filling them means parsing the files, which
+    `manage.py reindex_uploads` does with the code of the day.
+    """
+    ScannedAWB = apps.get_model('core', 'ScannedAWB')
+    ReturnBatch = apps.get_model('core', 'ReturnBatch')
+
+    ScannedAWB.objects.update(matched=None)
+    ReturnBatch.classified_uploads.through.objects.all().delete()
+    ReturnBatch.objects.update(parcel_count=0, matched_count=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_normalize_awbs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedrow',
+            name='delivered_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedrow',
+            name='return_reason',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='uploadedrow',
+            name='return_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='uploadedrow',
+            name='sku',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='ReturnRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku', models.CharField(blank=True, max_length=255)),
+                ('courier_partner', models.CharField(blank=True, max_length=100)),
+                ('return_type', models.CharField(blank=True, max_length=100)),
+                ('return_reason', models.CharField(blank=True, max_length=255)),
+                ('delivered_date', models.DateField(blank=True, null=True)),
+                ('parcels', models.PositiveIntegerField(default=0)),
+                ('matched', models.PositiveIntegerField(default=0)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='core.returnbatch')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('batch', 'sku', 'courier_partner', 'return_type', 'return_reason', 'delivered_date'), name='returnrollup_unique_group')],
+            },
+        ),
+        migrations.RunPython(reset_classification, migrations.RunPython.noop),
+    ]
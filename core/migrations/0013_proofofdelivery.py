@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProofOfDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255)),
+                ('awb_number', models.CharField(blank=True, max_length=255)),
+                ('otp', models.CharField(blank=True, max_length=20)),
+                ('matched', models.BooleanField(default=False)),
+                ('error', models.TextField(blank=True)),
+                ('checked_at', models.DateTimeField(auto_now=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pods', to='core.returnbatch')),
+            ],
+            options={
+                'ordering': ['file_name'],
+                'constraints': [models.UniqueConstraint(fields=('batch', 'file_name'), name='proofofdelivery_unique_file')],
+            },
+        ),
+    ]
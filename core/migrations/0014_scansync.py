@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_proofofdelivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('response', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='syncs', to='core.returnbatch')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('batch', 'key'), name='scansync_unique_key')],
+            },
+        ),
+    ]
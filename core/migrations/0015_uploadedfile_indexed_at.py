@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:13
+
+from django.db import migrations, models
+from django.db.models import Count, F, Q
+
+
+def mark_indexed_uploads(apps, schema_editor):
+    """
+    Mark the uploads whose index was saved, and fold repeat uploads of the
+    same content into one so that content_hash can be unique: the indexed
+    one, else the oldest. Batches that used a folded upload are reset to be
+    reclassified on their next compare; the folded files are left for
+    prune_uploads to remove.
+    """
+    UploadedFile = apps.get_model('core', 'UploadedFile')
+    ReturnBatch = apps.get_model('core', 'ReturnBatch')
+    ReturnRollup = apps.get_model('core', 'ReturnRollup')
+    ScannedAWB = apps.get_model('core', 'ScannedAWB')
+
+    # A failed index left neither an AWB column nor a row count behind
+    UploadedFile.objects.filter(Q(row_count__gt=0) | ~Q(awb_column='')).update(indexed_at=F('uploaded_at'))
+
+    repeated = (UploadedFile.objects.exclude(content_hash='').values('content_hash')
+                .annotate(copies=Count('id')).filter(copies__gt=1).values_list('content_hash', flat=True))
+    reset = set()
+    for digest in list(repeated):
+        kept, *folded = UploadedFile.objects.filter(content_hash=digest).order_by(
+            F('indexed_at').asc(nulls_last=True), 'id')
+        for upload in folded:
+            for batch in upload.batches.all():
+                batch.uploads.add(kept)
+                reset.add(batch.id)
+            kept.last_used_at = max(kept.last_used_at, upload.last_used_at)
+            upload.delete()
+        kept.save(update_fields=['last_used_at'])
+
+    ScannedAWB.objects.filter(batch__in=reset).update(matched=None)
+    ReturnBatch.classified_uploads.through.objects.filter(returnbatch__in=reset).delete()
+    ReturnBatch.objects.filter(id__in=reset).update(parcel_count=0, matched_count=0)
+    ReturnRollup.objects.filter(batch__in=reset).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_scansync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='indexed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_indexed_uploads, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='uploadedfile',
+            constraint=models.UniqueConstraint(condition=models.Q(('content_hash', ''), _negated=True), fields=('content_hash',), name='uploadedfile_unique_content'),
+        ),
+    ]
@@ -1,15 +1,167 @@
 from django.db import models
+from django.utils import timezone
 
 class UploadedFile(models.Model):
     file_name = models.CharField(max_length=255)
-    content = models.TextField()
+    file = models.FileField(upload_to='uploads/')
+    awb_column = models.CharField(max_length=100, blank=True)
+    row_count = models.PositiveIntegerField(default=0)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever the same content is uploaded again; drives retention
+    last_used_at = models.DateTimeField(default=timezone.now)
+    # Set once the row index is saved; repeat uploads only reuse the index then
+    indexed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_hash'], condition=~models.Q(content_hash=''),
+                                    name='uploadedfile_unique_content'),
+        ]
 
     def __str__(self):
         return self.file_name
 
+class UploadedRow(models.Model):
+    upload = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name='rows')
+    row_number = models.PositiveIntegerField()
+    awb_number = models.CharField(max_length=255)
+    order_number = models.CharField(max_length=100, blank=True)
+    suborder_number = models.CharField(max_length=100, blank=True)
+    courier_partner = models.CharField(max_length=100, blank=True)
+    sku = models.CharField(max_length=255, blank=True)
+    return_type = models.CharField(max_length=100, blank=True)
+    return_reason = models.CharField(max_length=255, blank=True)
+    delivered_date = models.DateField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['row_number']
+        constraints = [
+            models.UniqueConstraint(fields=['upload', 'row_number'], name='uploadedrow_unique_row'),
+        ]
+        indexes = [
+            models.Index(fields=['upload', 'awb_number'], name='uploadedrow_awb_idx'),
+        ]
+
+class ReturnBatch(models.Model):
+    """One operator's return run: the export(s) it is checked against and its scans."""
+    name = models.CharField(max_length=255, blank=True)
+    uploads = models.ManyToManyField(UploadedFile, related_name='batches')
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Running classification kept by indexing.classify_batch: the uploads and
+    # scans folded in so far and the counts they add up to
+    classified_uploads = models.ManyToManyField(UploadedFile, related_name='+', blank=True)
+    parcel_count = models.PositiveIntegerField(default=0)
+    matched_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+
+    def __str__(self):
+        return self.name or f"Batch {self.pk}"
+
+    @property
+    def rows(self):
+        return UploadedRow.objects.filter(upload__batches=self)
+
+    @property
+    def unmatched_count(self):
+        return self.parcel_count - self.matched_count
+
+    @property
+    def has_awb_column(self):
+        return self.uploads.exclude(awb_column='').exists()
+
 class ScannedAWB(models.Model):
+    batch = models.ForeignKey(ReturnBatch, on_delete=models.CASCADE, related_name='scans')
     awb_number = models.CharField(max_length=100)
     scanned_at = models.DateTimeField(auto_now_add=True)
-    
-    
+    # None until classify_batch has checked it against the batch's uploads
+    matched = models.BooleanField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['batch', 'awb_number'], name='scannedawb_unique_per_batch'),
+        ]
+        indexes = [
+            models.Index(fields=['batch', 'matched'], name='scannedawb_matched_idx'),
+        ]
+
+class ScanSync(models.Model):
+    """A scanner micro-batch already applied, kept so that a retry gets the same answer."""
+    batch = models.ForeignKey(ReturnBatch, on_delete=models.CASCADE, related_name='syncs')
+    # The Idempotency-Key the scanner page sent the micro-batch with
+    key = models.CharField(max_length=64)
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['batch', 'key'], name='scansync_unique_key'),
+        ]
+
+class ReturnRollup(models.Model):
+    """
+    Parcel and matched counts of a batch per SKU, courier, return type and
+    reason and delivery day, kept up to date by classify_batch.
+    """
+    DIMENSIONS = ['sku', 'courier_partner', 'return_type', 'return_reason', 'delivered_date']
+
+    batch = models.ForeignKey(ReturnBatch, on_delete=models.CASCADE, related_name='rollups')
+    sku = models.CharField(max_length=255, blank=True)
+    courier_partner = models.CharField(max_length=100, blank=True)
+    return_type = models.CharField(max_length=100, blank=True)
+    return_reason = models.CharField(max_length=255, blank=True)
+    delivered_date = models.DateField(null=True, blank=True)
+    parcels = models.PositiveIntegerField(default=0)
+    matched = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['batch', 'sku', 'courier_partner', 'return_type', 'return_reason',
+                                            'delivered_date'], name='returnrollup_unique_group'),
+        ]
+
+    @property
+    def unmatched(self):
+        return self.parcels - self.matched
+
+class ProofOfDelivery(models.Model):
+    """A proof-of-delivery PDF from a bulk POD upload, checked against the batch's uploads."""
+    batch = models.ForeignKey(ReturnBatch, on_delete=models.CASCADE, related_name='pods')
+    file_name = models.CharField(max_length=255)
+    # The uploaded AWB found in the PDF, else the first AWB-like text in it
+    awb_number = models.CharField(max_length=255, blank=True)
+    otp = models.CharField(max_length=20, blank=True)
+    matched = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+    checked_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['file_name']
+        constraints = [
+            models.UniqueConstraint(fields=['batch', 'file_name'], name='proofofdelivery_unique_file'),
+        ]
+
+class ReportJob(models.Model):
+    """Background build of a batch's matched/unmatched reports."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    ACTIVE = [QUEUED, RUNNING]
+
+    batch = models.ForeignKey(ReturnBatch, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    version = models.CharField(max_length=32)
+    matched_count = models.PositiveIntegerField(default=0)
+    unmatched_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
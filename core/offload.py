@@ -0,0 +1,73 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+_done = object()
+
+FILE_CHUNK_BYTES = 256 * 1024
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.OFFLOAD_WORKERS,
+                                           thread_name_prefix='offload')
+        return _executor
+
+def _call(fn, args, kwargs):
+    close_old_connections()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+async def offload(fn, *args, **kwargs):
+    """
+    Run blocking work (parsing, matching, ORM calls, file I/O) from an async
+    view on the offload threads, so the event loop keeps serving other
+    requests meanwhile. Metric spans recorded there count towards the request.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), context.run, _call, fn, args, kwargs)
+
+def joined(chunks, size):
+    """Join every `size` strings or bytes of `chunks` into one."""
+    chunks = iter(chunks)
+    while group := list(islice(chunks, size)):
+        yield group[0][:0].join(group)
+
+def file_chunks(path, size=FILE_CHUNK_BYTES):
+    with open(path, 'rb') as f:
+        while chunk := f.read(size):
+            yield chunk
+
+async def aiterate(iterable):
+    """
+    Yield from a blocking iterable, advancing it on a thread of its own: a
+    queryset iterator's cursor has to stay on the thread that opened it.
+    Give it coarse chunks, every item costs a thread hop. Like a streamed
+    body served by WSGI, its spans only reach /metrics.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = iter(iterable)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='stream') as thread:
+        try:
+            while (item := await loop.run_in_executor(thread, next, iterator, _done)) is not _done:
+                yield item
+        finally:
+            await loop.run_in_executor(thread, _close, iterator)
+
+def _close(iterator):
+    try:
+        if hasattr(iterator, 'close'):
+            iterator.close()
+    finally:
+        close_old_connections()
@@ -0,0 +1,147 @@
+import json
+import multiprocessing
+import os
+import re
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+
+from .indexing import normalize_awb
+from .metrics import span, timed
+from .models import ProofOfDelivery
+
+# Only the first pages carry the AWB and OTP; later ones are photos
+POD_PAGES = 2
+# Results matched and saved together, and PDFs handed to a worker at a time
+POD_SAVE_BATCH = 100
+POD_TASK_CHUNK = 8
+
+# AWBs are 8-20 letters and digits with at least one digit, e.g. R1322962572FPL
+AWB_CANDIDATE = re.compile(r'\b(?=[A-Z]*\d)[A-Z0-9]{8,20}\b')
+OTP = re.compile(r'OTP\D{0,20}?(\d{4,6})\b', re.IGNORECASE)
+
+# Zip path -> open ZipFile, per worker process; the server process opens
+# and closes the archive around its own reads instead
+_archives = {}
+
+def store_pod_zip(file):
+    """Write an uploaded ZIP under media/pods and return its path."""
+    pod_dir = os.path.join(settings.MEDIA_ROOT, 'pods')
+    os.makedirs(pod_dir, exist_ok=True)
+    path = os.path.join(pod_dir, f"{uuid.uuid4()}.zip")
+    with open(path, 'wb') as dest:
+        for chunk in file.chunks():
+            dest.write(chunk)
+    return path
+
+def pdf_names(path):
+    """The PDFs inside a ZIP, skipping folders and macOS resource forks."""
+    with zipfile.ZipFile(path) as archive:
+        return [name for name in archive.namelist()
+                if name.lower().endswith('.pdf') and '__MACOSX/' not in name]
+
+def read_pod(task):
+    """
+    Extract (name, AWB candidates, OTP, error) from one PDF of a ZIP. Runs in
+    a worker process; each worker opens the archive once and reads entries
+    itself, so PDF bytes never cross the process boundary.
+    """
+    path, name = task
+    archive = _archives.get(path)
+    if archive is None:
+        archive = _archives[path] = zipfile.ZipFile(path)
+    return read_pdf(archive, name)
+
+def read_pdf(archive, name):
+    """(name, AWB candidates, OTP, error) of one PDF in an open ZipFile."""
+    import pymupdf
+
+    try:
+        with pymupdf.open(stream=archive.read(name), filetype='pdf') as doc:
+            text = '\n'.join(doc[i].get_text() for i in range(min(POD_PAGES, doc.page_count)))
+    except Exception as exc:
+        return name, [], '', f'{type(exc).__name__}: {exc}'
+
+    candidates = dict.fromkeys(normalize_awb(c) for c in AWB_CANDIDATE.findall(text.upper()))
+    otp = OTP.search(text)
+    return name, [c for c in candidates if c], otp.group(1) if otp else '', ''
+
+def iter_pod_results(path):
+    """(name, candidates, otp, error) for every PDF in the ZIP, in archive order."""
+    tasks = [(path, name) for name in pdf_names(path)]
+    if settings.POD_WORKERS <= 1 or len(tasks) <= POD_TASK_CHUNK:
+        with zipfile.ZipFile(path) as archive:
+            for _, name in tasks:
+                yield read_pdf(archive, name)
+        return
+    # Spawned, not forked: under ASGI this runs on a stream thread, and a
+    # child forked while another thread holds a lock can deadlock
+    with ProcessPoolExecutor(max_workers=settings.POD_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=django.setup) as pool:
+        yield from pool.map(read_pod, tasks, chunksize=POD_TASK_CHUNK)
+
+def save_pod_results(batch, results):
+    """
+    Match a block of extracted PODs against the batch's uploads and store
+    them, replacing earlier checks of the same file names. A POD matches on
+    the first of its candidates that is an uploaded AWB.
+    """
+    wanted = {c for _, candidates, _, _ in results for c in candidates}
+    with span('match'):
+        listed = set(batch.rows.filter(awb_number__in=wanted).values_list('awb_number', flat=True).distinct())
+
+    pods = []
+    for name, candidates, otp, error in results:
+        awb = next((c for c in candidates if c in listed), None)
+        first = candidates[0] if candidates else ''
+        pods.append(ProofOfDelivery(batch=batch, file_name=name[:255], awb_number=awb or first,
+                                    otp=otp, matched=awb is not None, error=error))
+    ProofOfDelivery.objects.bulk_create(
+        pods, update_conflicts=True, unique_fields=['batch', 'file_name'],
+        update_fields=['awb_number', 'otp', 'matched', 'error', 'checked_at'],
+    )
+    return pods
+
+def check_pods(batch, path):
+    """
+    Process a stored ZIP of POD PDFs for a batch, yielding NDJSON progress:
+    a line per PDF, sent a saved block at a time, then a summary with the
+    batch's totals.
+    The ZIP is deleted at the end.
+    """
+    results = None
+    try:
+        try:
+            total = len(pdf_names(path))
+        except zipfile.BadZipFile:
+            yield json.dumps({'error': 'Not a ZIP file'}) + '\n'
+            return
+
+        done = matched = 0
+        block = []
+        results = timed(iter_pod_results(path), 'pod')
+        for result in results:
+            block.append(result)
+            if len(block) < POD_SAVE_BATCH and done + len(block) < total:
+                continue
+            lines = []
+            for pod in save_pod_results(batch, block):
+                done += 1
+                matched += pod.matched
+                lines.append(json.dumps({'done': done, 'total': total, 'file': pod.file_name, 'awb': pod.awb_number,
+                                         'otp': pod.otp, 'matched': pod.matched, 'error': pod.error}) + '\n')
+            yield ''.join(lines)
+            block = []
+
+        yield json.dumps({'done': done, 'total': total, 'matched': matched, 'unmatched': done - matched,
+                          'batch_checked': batch.pods.count(),
+                          'batch_matched': batch.pods.filter(matched=True).count(),
+                          'finished': True}) + '\n'
+    finally:
+        # Closes the archive first, or the ZIP cannot be removed on Windows
+        if results is not None:
+            results.close()
+        os.remove(path)
@@ -0,0 +1,86 @@
+import csv
+import glob
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+
+from .ingest import iter_upload_chunks
+from .metrics import span, timed
+
+def report_version(batch):
+    """
+    Content version of a classified batch's reports: its uploads and how many
+    AWBs are matched. With the uploads fixed the matched set only ever grows,
+    so its size identifies it; scans that touch no uploaded row leave it as is.
+    """
+    digest = hashlib.sha1()
+    digest.update(','.join(str(pk) for pk in batch.uploads.order_by('id').values_list('id', flat=True)).encode())
+    digest.update(b';%d' % batch.matched_count)
+    return digest.hexdigest()[:16]
+
+def iter_report_rows(batch, matched):
+    """
+    Yield the header and then every matched (or unmatched) row of a batch's
+    uploads as a list of strings, reading each stored file one chunk at a time.
+    """
+    header, seen = None, set()
+    matched_awbs = set(batch.scans.filter(matched=True).values_list('awb_number', flat=True))
+    for upload in batch.uploads.order_by('id'):
+        awbs = dict(upload.rows.values_list('row_number', 'awb_number'))
+
+        for chunk in timed(iter_upload_chunks(upload.file.path, columns=None), 'parse'):
+            if header is None:
+                header = list(chunk.columns)
+                yield header + ['__awb__']
+            chunk = chunk.reindex(columns=header)
+            chunk = chunk.astype(object).where(chunk.notna(), '')
+            for row, values in zip(chunk.index, chunk.values.tolist()):
+                # Only the first file listing an AWB reports it
+                awb = awbs.get(row)
+                if awb is None or awb in seen:
+                    continue
+                if awb:
+                    seen.add(awb)
+                if (awb in matched_awbs) == matched:
+                    yield values + [awb]
+
+class Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+    def write(self, value):
+        return value
+
+def stream_csv(batch, matched):
+    writer = csv.writer(Echo())
+    return timed((writer.writerow(row) for row in iter_report_rows(batch, matched)), 'write')
+
+@span('write')
+def write_xlsx(batch, matched, path):
+    """Write a report with openpyxl's write-only workbook, one row at a time."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    for row in iter_report_rows(batch, matched):
+        ws.append(row)
+    wb.save(path)
+
+def cached_report(batch, matched):
+    """Path of the matched/unmatched workbook, built only if its version is new."""
+    kind = 'matched' if matched else 'unmatched'
+    report_dir = os.path.join(settings.MEDIA_ROOT, 'reports', str(batch.id))
+    os.makedirs(report_dir, exist_ok=True)
+
+    path = os.path.join(report_dir, f"{report_version(batch)}-{kind}.xlsx")
+    if os.path.exists(path):
+        return path
+
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    write_xlsx(batch, matched, tmp_path)
+    os.replace(tmp_path, path)
+
+    for stale in glob.glob(os.path.join(report_dir, f"*-{kind}.xlsx")):
+        if stale != path:
+            os.remove(stale)
+    return path
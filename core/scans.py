@@ -0,0 +1,54 @@
+from .history import repeat_batches
+from .indexing import normalize_awb
+from .metrics import span
+from .models import ScannedAWB
+
+SCAN_BATCH_SIZE = 1000
+
+def parse_scanned_data(scanned_data):
+    awbs = (normalize_awb(a) for a in scanned_data.replace('\n', ',').split(','))
+    return {awb for awb in awbs if awb}
+
+def record_scans(batch, awbs):
+    """
+    Insert scanned AWBs into a return batch, silently skipping ones it already
+    has, and return the ones that were new. The unique (batch, awb_number)
+    index makes this safe for concurrent stations.
+    """
+    awbs = set(awbs)
+    existing = set(batch.scans.filter(awb_number__in=awbs).values_list('awb_number', flat=True))
+    ScannedAWB.objects.bulk_create(
+        [ScannedAWB(batch=batch, awb_number=awb) for awb in awbs - existing],
+        batch_size=SCAN_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    return awbs - existing
+
+def scan_results(batch, scanned):
+    """
+    Per-scan feedback for a batch of raw scanner values: the normalized AWB,
+    whether it is new, where it matched and which earlier batches it was
+    already returned in.
+    """
+    with span('normalize'):
+        scanned = {value: normalize_awb(value) for value in scanned}
+    scanned = {value: awb for value, awb in scanned.items() if awb}
+    awbs = list(dict.fromkeys(scanned.values()))
+    new = record_scans(batch, awbs)
+
+    rows = {}
+    with span('match'):
+        for row in batch.rows.filter(awb_number__in=awbs).values(
+                'awb_number', 'upload_id', 'row_number', 'order_number', 'suborder_number', 'courier_partner'):
+            rows.setdefault(row.pop('awb_number'), row)
+    repeats = repeat_batches(batch, awbs)
+
+    results, reported = [], set()
+    for value, awb in scanned.items():
+        results.append({'scanned': value, 'awb': awb, 'new': awb in new and awb not in reported,
+                        'matched': awb in rows, 'row': rows.get(awb), 'repeat': repeats.get(awb, [])})
+        reported.add(awb)
+    return results
+
+def has_scans(batch):
+    return batch.scans.exists()
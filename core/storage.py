@@ -0,0 +1,97 @@
+import os
+import shutil
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .history import merge_history
+from .ingest import store_upload
+from .models import ReturnBatch, ScanSync, UploadedFile
+
+def save_upload(file):
+    """
+    Store an uploaded file and return (UploadedFile, indexed). Content that
+    was uploaded before maps to the existing record and its file; the fresh
+    copy is deleted again. `indexed` is false unless that record's index was
+    saved, so content whose indexing failed or is still running is indexed
+    (again) by the caller rather than reused half-built.
+    """
+    path, digest = store_upload(file)
+    try:
+        with transaction.atomic():
+            return UploadedFile.objects.create(file_name=file.name, file=path, content_hash=digest), False
+    except IntegrityError:
+        # The same content is on record, maybe from a concurrent request
+        pass
+
+    existing = UploadedFile.objects.get(content_hash=digest)
+    if existing.file.storage.exists(existing.file.name):
+        os.remove(os.path.join(settings.MEDIA_ROOT, path))
+    else:
+        existing.file = path
+    existing.last_used_at = timezone.now()
+    existing.save(update_fields=['file', 'last_used_at'])
+    return existing, existing.indexed_at is not None
+
+def prune_batches(now=None):
+    """
+    Apply BATCH_RETENTION_DAYS, which is off by default: batches with no
+    upload or scan inside the window are deleted with their scans, rollups,
+    POD checks and reports. Their scans are merged into the AWB history
+    first. Returns the number of batches deleted.
+    """
+    if settings.BATCH_RETENTION_DAYS <= 0:
+        return 0
+    cutoff = (now or timezone.now()) - timedelta(days=settings.BATCH_RETENTION_DAYS)
+
+    batch_ids = list(ReturnBatch.objects.filter(created_at__lt=cutoff)
+                     .exclude(uploads__last_used_at__gte=cutoff)
+                     .exclude(scans__scanned_at__gte=cutoff)
+                     .values_list('id', flat=True))
+    if batch_ids:
+        # Their scans live on in the AWB history
+        merge_history()
+    ReturnBatch.objects.filter(id__in=batch_ids).delete()
+    for batch_id in batch_ids:
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, 'reports', str(batch_id)), ignore_errors=True)
+    return len(batch_ids)
+
+def prune_scan_syncs(now=None):
+    """
+    Apply SCAN_SYNC_RETENTION_DAYS to the answers kept for Idempotency-Key
+    retries. Returns the number deleted.
+    """
+    if settings.SCAN_SYNC_RETENTION_DAYS <= 0:
+        return 0
+    cutoff = (now or timezone.now()) - timedelta(days=settings.SCAN_SYNC_RETENTION_DAYS)
+    return ScanSync.objects.filter(created_at__lt=cutoff).delete()[0]
+
+def prune_uploads(now=None):
+    """
+    Apply UPLOAD_RETENTION_DAYS to uploads no batch uses, then to files under
+    media/uploads that no upload points at. Batches are left alone.
+    Returns (uploads, files) deleted.
+    """
+    if settings.UPLOAD_RETENTION_DAYS <= 0:
+        return 0, 0
+    cutoff = (now or timezone.now()) - timedelta(days=settings.UPLOAD_RETENTION_DAYS)
+
+    stale = list(UploadedFile.objects.filter(last_used_at__lt=cutoff, batches__isnull=True))
+    for upload in stale:
+        upload.file.delete(save=False)
+        upload.delete()
+
+    upload_dir = os.path.join(settings.MEDIA_ROOT, 'uploads')
+    if not os.path.isdir(upload_dir):
+        return len(stale), 0
+
+    referenced = set(UploadedFile.objects.values_list('file', flat=True))
+    removed = 0
+    for entry in os.scandir(upload_dir):
+        if entry.is_file() and os.path.join('uploads', entry.name) not in referenced \
+                and entry.stat().st_mtime < cutoff.timestamp():
+            os.remove(entry.path)
+            removed += 1
+    return len(stale), removed
@@ -0,0 +1,81 @@
+from collections import defaultdict
+
+from .metrics import span
+from .models import UploadedRow
+
+# ((upload id, indexed_at), ...) -> NearMatchIndex. An upload's rows only
+# change when it is indexed again, e.g. by reindex_uploads in another
+# process, which moves indexed_at on and so misses the stale entry.
+_index_cache = {}
+INDEX_CACHE_SIZE = 8
+
+def within_one_edit(a, b):
+    """True if a and b differ by at most one insertion, deletion or substitution."""
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > 1:
+        return False
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+class NearMatchIndex:
+    """
+    Finds AWBs one edit away from a scan without comparing against all of
+    them. A single edit in a string of length n leaves either its first n//2
+    characters or everything after position n//2 untouched, so each AWB is
+    filed under that prefix and that suffix, and a lookup only checks the few
+    AWBs sharing one of them for each of the three possible target lengths.
+    """
+    def __init__(self, awbs):
+        self.awbs = set(awbs)
+        self.keys = defaultdict(list)
+        for awb in self.awbs:
+            n = len(awb)
+            self.keys[f'{n}<{awb[:n // 2]}'].append(awb)
+            self.keys[f'{n}>{awb[n // 2 + 1:]}'].append(awb)
+
+    def lookup(self, awb):
+        """AWBs exactly one edit away from `awb`, closest in length first."""
+        found = []
+        for n in (len(awb), len(awb) - 1, len(awb) + 1):
+            if n < 1:
+                continue
+            suffix = n - n // 2 - 1
+            for key in (f'{n}<{awb[:n // 2]}', f'{n}>{awb[len(awb) - suffix:] if suffix else ""}'):
+                for candidate in self.keys.get(key, ()):
+                    if candidate != awb and candidate not in found and within_one_edit(awb, candidate):
+                        found.append(candidate)
+        return found
+
+def near_match_index(batch):
+    key = tuple(batch.uploads.order_by('id').values_list('id', 'indexed_at'))
+    index = _index_cache.get(key)
+    if index is None:
+        awbs = UploadedRow.objects.filter(upload__in=[upload_id for upload_id, _ in key]).exclude(awb_number='')
+        index = NearMatchIndex(awbs.values_list('awb_number', flat=True).distinct().iterator())
+        if len(_index_cache) >= INDEX_CACHE_SIZE:
+            _index_cache.pop(next(iter(_index_cache)))
+        _index_cache[key] = index
+    return index
+
+@span('suggest')
+def suggest_matches(batch, awbs):
+    """
+    Near matches for unmatched scans: {scanned AWB: [uploaded rows one edit
+    away]}, each row a dict of its AWB, order and courier. Scans with no
+    candidate are left out.
+    """
+    index = near_match_index(batch)
+    candidates = {awb: index.lookup(awb) for awb in awbs}
+    candidates = {awb: found for awb, found in candidates.items() if found}
+
+    rows = {}
+    wanted = {c for found in candidates.values() for c in found}
+    for row in batch.rows.filter(awb_number__in=wanted).values(
+            'awb_number', 'order_number', 'suborder_number', 'courier_partner'):
+        rows.setdefault(row['awb_number'], row)
+    return {awb: [rows[c] for c in found if c in rows] for awb, found in candidates.items()}
@@ -1,13 +0,0 @@
-from django import template
-
-register = template.Library()
-
-@register.filter
-def get_item(dictionary, key):
-    """
-    Template filter to get dictionary item by key
-    Usage: {{ dict|get_item:key }}
-    """
-    if isinstance(dictionary, dict):
-        return dictionary.get(key, '')
-    return ''
\ No newline at end of file
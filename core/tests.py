@@ -1,3 +1,342 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import random
+import shutil
+import tempfile
+import zipfile
+from datetime import date, timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from . import history, pods
+from .indexing import build_upload_index, classify_batch, normalize_awb, save_upload_index
+from .ingest import UnreadableUpload, iter_csv_rows, iter_upload_chunks
+from .models import ReturnBatch, ScannedAWB, ScanSync, UploadedFile, UploadedRow
+from .scans import record_scans
+from .storage import prune_scan_syncs, prune_uploads, save_upload
+from .suggestions import NearMatchIndex, near_match_index, within_one_edit
+from .views import SCAN_BODY_MAX_BYTES, ingest_uploads
+
+def make_upload(name, rows):
+    """An indexed upload with no file behind it; rows are (AWB, SKU, courier)."""
+    upload = UploadedFile.objects.create(file_name=name, file=f'uploads/{name}', awb_column='AWB Number',
+                                         row_count=len(rows))
+    UploadedRow.objects.bulk_create(
+        UploadedRow(upload=upload, row_number=n, awb_number=awb, sku=sku, courier_partner=courier,
+                    delivered_date=date(2025, 7, 21))
+        for n, (awb, sku, courier) in enumerate(rows))
+    return upload
+
+class ClassifyBatchTests(TestCase):
+    def setUp(self):
+        self.first = make_upload('first.csv', [('AWB1', 'S1', 'Valmo'), ('AWB2', 'S1', 'Valmo'),
+                                               ('AWB2', 'S2', 'Valmo')])
+        self.second = make_upload('second.csv', [('AWB2', 'S2', 'Delhivery'), ('AWB3', 'S2', 'Delhivery')])
+        self.batch = ReturnBatch.objects.create(name='test')
+        self.batch.uploads.add(self.first, self.second)
+
+    def assertRollupsAddUp(self, batch):
+        totals = batch.rollups.aggregate(parcels=Sum('parcels'), matched=Sum('matched'))
+        self.assertEqual(totals['parcels'], batch.parcel_count)
+        self.assertEqual(totals['matched'] or 0, batch.matched_count)
+
+    def test_awb_listed_in_several_files_is_one_parcel(self):
+        batch = classify_batch(self.batch)
+        self.assertEqual(batch.parcel_count, 3)
+        self.assertEqual(batch.matched_count, 0)
+        self.assertRollupsAddUp(batch)
+        # AWB2 counts in the group of its first row
+        self.assertEqual(batch.rollups.get(sku='S1', courier_partner='Valmo').parcels, 2)
+        self.assertEqual(batch.rollups.get(sku='S2', courier_partner='Delhivery').parcels, 1)
+        self.assertFalse(batch.rollups.filter(sku='S2', courier_partner='Valmo').exists())
+
+    def test_scans_are_classified_incrementally(self):
+        record_scans(self.batch, ['AWB2', 'NOPE'])
+        batch = classify_batch(self.batch)
+        self.assertEqual((batch.parcel_count, batch.matched_count, batch.unmatched_count), (3, 1, 2))
+        self.assertEqual(set(batch.scans.values_list('awb_number', 'matched')), {('AWB2', True), ('NOPE', False)})
+
+        record_scans(self.batch, ['AWB3', 'AWB2'])
+        batch = classify_batch(batch)
+        self.assertEqual(batch.matched_count, 2)
+        self.assertEqual(classify_batch(batch).matched_count, 2)
+        self.assertRollupsAddUp(batch)
+
+    def test_new_upload_matches_earlier_scans(self):
+        record_scans(self.batch, ['AWB1', 'AWB4'])
+        classify_batch(self.batch)
+        self.batch.uploads.add(make_upload('third.csv', [('AWB4', 'S3', 'Valmo'), ('AWB1', 'S3', 'Valmo')]))
+
+        batch = classify_batch(self.batch)
+        self.assertEqual((batch.parcel_count, batch.matched_count), (4, 2))
+        self.assertEqual(batch.rollups.get(sku='S3').matched, 1)
+        self.assertRollupsAddUp(batch)
+
+class NormalizeAwbTests(SimpleTestCase):
+    def test_cases(self):
+        cases = {
+            'https://track.shadowfax.in/track?order=return&trackingId=R1322962572FPL': 'R1322962572FPL',
+            'https://www.delhivery.com/track/package/1490008143511620': '1490008143511620',
+            ' r1322-9625 72fpl ': 'R1322962572FPL',
+            '1.34001E+14': '134001000000000',
+            '134001394216013.0': '134001394216013',
+            '00012345678': '12345678',
+            '0000': '0',
+            '': '',
+            None: '',
+            float('nan'): '',
+        }
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(normalize_awb(value), expected)
+
+    def test_idempotent(self):
+        for value in ['R1322962572FPL', '134001394216013', 'VL0006538409702', '1.73E+17']:
+            self.assertEqual(normalize_awb(normalize_awb(value)), normalize_awb(value))
+
+class NearMatchIndexTests(SimpleTestCase):
+    def test_one_edit(self):
+        index = NearMatchIndex(['R1322962572FPL', 'M01668967147', '134001394216013'])
+        self.assertEqual(index.lookup('R1322962573FPL'), ['R1322962572FPL'])
+        self.assertEqual(index.lookup('R132296257FPL'), ['R1322962572FPL'])
+        self.assertEqual(index.lookup('M016689671470'), ['M01668967147'])
+        self.assertEqual(index.lookup('134001394216031'), [])
+        self.assertEqual(index.lookup('M01668967147'), [])
+
+    def test_agrees_with_brute_force(self):
+        rng = random.Random(46232)
+        awbs = [''.join(rng.choice('0123') for _ in range(rng.randint(1, 7))) for _ in range(300)]
+        index = NearMatchIndex(awbs)
+        for scan in awbs[:100] + ['', '0', '12', '3210321']:
+            with self.subTest(scan=scan):
+                expected = {awb for awb in awbs if awb != scan and within_one_edit(scan, awb)}
+                self.assertEqual(set(index.lookup(scan)), expected)
+
+class IterCsvRowsTests(SimpleTestCase):
+    def test_row_numbers_match_pandas(self):
+        body = 'Supplier ID,1\n\nAWB Number,SKU\nA1,S1\n\n  \n \t\n,\nA2 , S2\n"A3\n",S3\n'
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, 'export.csv')
+            with open(path, 'w', newline='') as f:
+                f.write(body)
+            rows = list(iter_csv_rows(path, ['AWB Number', 'SKU', 'Courier Partner']))
+            chunks = [(row, [awb, sku]) for chunk in iter_upload_chunks(path, columns=['AWB Number', 'SKU'])
+                      for row, awb, sku in zip(chunk.index, chunk['AWB Number'], chunk['SKU'])]
+
+        self.assertEqual(rows, [(0, ['A1', 'S1', '']), (1, ['', '', '']), (2, ['A2', 'S2', '']),
+                                (3, ['A3', 'S3', ''])])
+        self.assertEqual([(row, values[:2]) for row, values in rows], chunks)
+
+class CheckPodsTests(TestCase):
+    def setUp(self):
+        import pymupdf
+
+        self.batch = ReturnBatch.objects.create(name='pods')
+        self.batch.uploads.add(make_upload('pods.csv', [('R1322962572FPL', 'S1', 'Shadowfax')]))
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'pods.zip')
+        with zipfile.ZipFile(self.path, 'w') as archive:
+            for name, text in [('a.pdf', 'AWB R1322962572FPL OTP: 4821'), ('b.pdf', 'AWB M00000000001')]:
+                with pymupdf.open() as doc:
+                    doc.new_page().insert_text((72, 72), text)
+                    archive.writestr(name, doc.tobytes())
+
+    def test_archive_is_closed_and_removed(self):
+        lines = [json.loads(line) for chunk in pods.check_pods(self.batch, self.path) for line in chunk.splitlines()]
+        self.assertEqual([(line['file'], line['matched'], line['otp']) for line in lines[:2]],
+                         [('a.pdf', True, '4821'), ('b.pdf', False, '')])
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(pods._archives, {})
+
+    def test_abandoned_check_removes_the_archive(self):
+        with self.settings(POD_WORKERS=1):
+            progress = pods.check_pods(self.batch, self.path)
+            next(progress)
+            progress.close()
+        self.assertFalse(os.path.exists(self.path))
+
+class SaveUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.media = self.settings(MEDIA_ROOT=media_root)
+        self.media.enable()
+        self.addCleanup(self.media.disable)
+        self.upload_dir = os.path.join(media_root, 'uploads')
+
+    def test_repeat_content_reuses_the_indexed_record(self):
+        data = b'AWB Number,SKU\nAWB1,S1\nAWB2,S2\n'
+        upload, indexed = save_upload(SimpleUploadedFile('july.csv', data))
+        self.assertFalse(indexed)
+        build_upload_index(upload)
+
+        again, indexed = save_upload(SimpleUploadedFile('july (1).csv', data))
+        self.assertEqual((again, indexed), (upload, True))
+        self.assertEqual(len(os.listdir(self.upload_dir)), 1)
+
+    def test_failed_index_is_not_reused(self):
+        data = b'not a workbook'
+        batches = ReturnBatch.objects.count()
+        for _ in range(2):
+            with self.assertRaises(UnreadableUpload):
+                ingest_uploads([SimpleUploadedFile('broken.xlsx', data)])
+        self.assertEqual(UploadedFile.objects.count(), 1)
+        self.assertEqual(ReturnBatch.objects.count(), batches)
+
+        upload, indexed = save_upload(SimpleUploadedFile('broken.xlsx', data))
+        self.assertIsNone(upload.indexed_at)
+        self.assertFalse(indexed)
+
+    def test_prune_deletes_only_old_unused_uploads(self):
+        old = timezone.now() - timedelta(days=settings.UPLOAD_RETENTION_DAYS + 1)
+        used = make_upload('used.csv', [('AWB1', 'S1', 'Valmo')])
+        ReturnBatch.objects.create(name='kept').uploads.add(used)
+        unused = make_upload('unused.csv', [('AWB2', 'S1', 'Valmo')])
+        recent = make_upload('recent.csv', [('AWB3', 'S1', 'Valmo')])
+        UploadedFile.objects.exclude(pk=recent.pk).update(last_used_at=old)
+
+        self.assertEqual(prune_uploads()[0], 1)
+        self.assertEqual(set(UploadedFile.objects.all()), {used, recent})
+        self.assertFalse(UploadedRow.objects.filter(upload_id=unused.pk).exists())
+
+class AwbHistoryTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = self.settings(MEDIA_ROOT=media_root, AWB_HISTORY_MERGE_SCANS=1000)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.first = ReturnBatch.objects.create(name='first')
+        self.second = ReturnBatch.objects.create(name='second')
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        import numpy as np
+
+        rng = np.random.default_rng(46232)
+        hashes = rng.integers(0, 2 ** 63, 5000, dtype=np.uint64)
+        bloom = history.BloomFilter.build(hashes, len(hashes) * history.BLOOM_BITS_PER_AWB)
+        self.assertTrue(bloom.might_contain(hashes).all())
+        others = rng.integers(0, 2 ** 63, 5000, dtype=np.uint64)
+        self.assertLess(bloom.might_contain(others).mean(), 0.05)
+
+    def test_lookup(self):
+        import numpy as np
+
+        path = history.history_dir()
+        os.makedirs(path)
+        hashes = history.awb_hashes(['AWB1', 'AWB2', 'AWB1', 'AWB1'])
+        store = history.write_history(path, hashes, np.array([1, 1, 2, 2], dtype=np.uint32), 4)
+        self.assertEqual(store.count, 3)
+        self.assertEqual(store.lookup(history.awb_hashes(['AWB3', 'AWB1', 'AWB2'])), {1: {1, 2}, 2: {1}})
+
+    def test_merged_covers_new_scans_once_enough_come_in(self):
+        record_scans(self.first, ['AWB1'])
+        store = history.build_history()
+        record_scans(self.second, ['AWB1', 'AWB2'])
+
+        self.assertIs(store.merged(min_new=3), store)
+        merged = store.merged(min_new=2)
+        self.assertEqual(merged.last_scan_id, ScannedAWB.objects.latest('id').id)
+        self.assertEqual(merged.lookup(history.awb_hashes(['AWB1', 'AWB2'])),
+                         {0: {self.first.id, self.second.id}, 1: {self.second.id}})
+        self.assertEqual(len(os.listdir(os.path.join(history.history_dir(), merged.name))), 3)
+        self.assertFalse(os.path.exists(os.path.join(history.history_dir(), store.name)))
+
+    def test_repeat_batches_include_scans_not_merged_yet(self):
+        record_scans(self.first, ['AWB1', 'AWB2'])
+        history.build_history()
+        record_scans(self.second, ['AWB2', 'AWB3'])
+        third = ReturnBatch.objects.create(name='third')
+        record_scans(third, ['AWB2'])
+
+        self.assertEqual(history.repeat_batches(third, ['AWB1', 'AWB2', 'AWB3', 'AWB4']),
+                         {'AWB1': [self.first.id], 'AWB2': [self.first.id, self.second.id],
+                          'AWB3': [self.second.id]})
+
+    def test_version_removed_under_a_reader_is_rebuilt(self):
+        record_scans(self.first, ['AWB1'])
+        store = history.build_history()
+        shutil.rmtree(os.path.join(history.history_dir(), store.name))
+        history._store = None
+
+        rebuilt = history.get_history()
+        self.assertNotEqual(rebuilt.name, store.name)
+        self.assertEqual(rebuilt.lookup(history.awb_hashes(['AWB1'])), {0: {self.first.id}})
+
+class AnalyticsViewTests(TestCase):
+    def test_batch_must_be_an_integer(self):
+        self.assertEqual(self.client.get('/analytics/', {'batch': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/analytics/', {'batch': '999999'}).status_code, 404)
+
+class ScanIngestTests(TransactionTestCase):
+    # The view saves from an offload thread, outside a test transaction
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = self.settings(MEDIA_ROOT=media_root, AWB_NEAR_MATCH=False)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.batch = ReturnBatch.objects.create(name='scans')
+        self.batch.uploads.add(make_upload('scans.csv', [('AWB1', 'S1', 'Valmo')]))
+        self.url = f'/api/batch/{self.batch.pk}/scans/'
+
+    def post(self, body, **headers):
+        return self.client.post(self.url, body, content_type='application/json', headers=headers)
+
+    def test_gzipped_body(self):
+        response = self.post(gzip.compress(json.dumps({'awbs': ['AWB1', 'AWB2']}).encode()), content_encoding='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['matched'] for r in response.json()['results']], [True, False])
+        self.assertEqual(response.json()['matched_count'], 1)
+
+    def test_body_over_the_cap_is_rejected(self):
+        awbs = [f'AWB{n:010d}' for n in range(SCAN_BODY_MAX_BYTES // 10)]
+        body = json.dumps({'awbs': awbs}).encode()
+        self.assertEqual(self.post(gzip.compress(body), content_encoding='gzip').status_code, 400)
+        self.assertEqual(self.post(body).status_code, 400)
+        self.assertFalse(self.batch.scans.exists())
+
+    def test_idempotency_key_replays_the_first_answer(self):
+        first = self.post(json.dumps({'awbs': ['AWB1']}), idempotency_key='k1').json()
+        retry = self.post(json.dumps({'awbs': ['AWB2']}), idempotency_key='k1').json()
+        self.assertEqual(retry, first)
+        self.assertEqual(list(self.batch.scans.values_list('awb_number', flat=True)), ['AWB1'])
+
+    def test_old_scan_syncs_are_pruned(self):
+        old = ScanSync.objects.create(batch=self.batch, key='old', response={})
+        ScanSync.objects.filter(pk=old.pk).update(
+            created_at=timezone.now() - timedelta(days=settings.SCAN_SYNC_RETENTION_DAYS + 1))
+        ScanSync.objects.create(batch=self.batch, key='new', response={})
+        self.assertEqual(prune_scan_syncs(), 1)
+        self.assertEqual(list(self.batch.syncs.values_list('key', flat=True)), ['new'])
+
+class UploadViewTests(TransactionTestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_unreadable_files_are_a_form_error(self):
+        for name in ['notes.txt', 'broken.xlsx']:
+            response = self.client.post('/upload/', {'files': SimpleUploadedFile(name, f'not {name}'.encode())})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(f'{name}: not a readable CSV or Excel workbook', response.context['form'].errors['files'][0])
+        self.assertFalse(ReturnBatch.objects.exists())
+
+class NearMatchCacheTests(TestCase):
+    def test_reindexed_upload_is_not_served_stale(self):
+        upload = make_upload('july.csv', [('R1322962572FPL', 'S1', 'Shadowfax')])
+        batch = ReturnBatch.objects.create(name='typos')
+        batch.uploads.add(upload)
+        self.assertEqual(near_match_index(batch).lookup('R1322962573FPL'), ['R1322962572FPL'])
+
+        save_upload_index(upload, ('AWB Number', 1, [(0, 'R1322962579FPL', '', '', '', '', '', '', None)]))
+        self.assertEqual(near_match_index(batch).lookup('R1322962573FPL'), ['R1322962579FPL'])
@@ -5,10 +5,16 @@ urlpatterns = [
     path('', include('auth_google.urls')),
     path('', views.home, name='home'),  
     path('upload/', views.upload_file, name='upload_file'),
-    path('scan/', views.scan_awb, name='scan_awb'),
-    path('save-scan/', views.save_scan, name='save_scan'),
-    path('compare/', views.compare_data, name='compare'),
-    path('download-matched/', views.download_matched, name='download_matched'),
-    path('download-unmatched/', views.download_unmatched, name='download_unmatched'),
+    path('upload/<int:upload_id>/preview/', views.upload_preview, name='upload_preview'),
+    path('batch/<int:batch_id>/scan/', views.scan_awb, name='scan_awb'),
+    path('batch/<int:batch_id>/save-scan/', views.save_scan, name='save_scan'),
+    path('batch/<int:batch_id>/compare/', views.compare_data, name='compare'),
+    path('batch/<int:batch_id>/download-matched/', views.download_matched, name='download_matched'),
+    path('batch/<int:batch_id>/download-unmatched/', views.download_unmatched, name='download_unmatched'),
+    path('api/batch/<int:batch_id>/scans/', views.scan_ingest, name='scan_ingest'),
+    path('batch/<int:batch_id>/pods/', views.pod_upload, name='pod_upload'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('analytics/', views.analytics, name='analytics'),
+    path('metrics', views.metrics_view, name='metrics'),
 
 ]
@@ -1,152 +1,355 @@
+import itertools
+import json
 import os
-import pandas as pd
-from django.shortcuts import render, redirect
+import zlib
 from django.conf import settings
-from django.http import HttpResponse
-import uuid
-import re
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F, Sum
+from django.shortcuts import aget_object_or_404, get_object_or_404, render, redirect
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from . import metrics
+from .forms import PodZipForm, UploadFileForm
+from .history import repeat_batches
+from .indexing import CLASSIFY_CHUNK, SMALL_CSV_BYTES, build_upload_indexes, classify_batch
+from .ingest import UnreadableUpload, is_csv, iter_csv_rows, read_upload, sniff_csv
+from .jobs import enqueue_report_job, fail_stale_jobs
+from .models import ReportJob, ReturnBatch, ReturnRollup, ScanSync, UploadedFile
+from .offload import aiterate, file_chunks, joined, offload
+from .pods import check_pods, store_pod_zip
+from .reports import cached_report, stream_csv
+from .scans import has_scans, parse_scanned_data, record_scans, scan_results
+from .storage import save_upload
+from .suggestions import suggest_matches
+
+PREVIEW_PAGE_SIZE = 50
+PREVIEW_MAX_PAGE_SIZE = 500
+RECENT_BATCHES = 20
+SUGGESTION_LIMIT = 200
+# CSV report lines handed to the server at a time
+CSV_STREAM_LINES = 500
+XLSX_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+ANALYTICS_LIMIT = 500
+POD_LIST_LIMIT = 200
+REPEAT_EXAMPLES = 20
+# Largest scan micro-batch accepted, once decompressed
+SCAN_BODY_MAX_BYTES = 1024 * 1024
+# ?by= value -> (ReturnRollup field, column heading)
+ANALYTICS_GROUPS = {
+    'sku': ('sku', 'SKU'),
+    'courier': ('courier_partner', 'Courier Partner'),
+    'type': ('return_type', 'Type of Return'),
+    'reason': ('return_reason', 'Return Reason'),
+    'day': ('delivered_date', 'Delivered Date'),
+}
 
 def home(request):
-    return render(request, 'home.html')
+    return render(request, 'home.html', {
+        'batches': ReturnBatch.objects.prefetch_related('uploads')[:RECENT_BATCHES],
+    })
+
+async def upload_file(request):
+    """
+    The ASGI handler has buffered the whole body before this runs. Being
+    async matters for what follows: storing, parsing and matching the files
+    is offloaded to the OFFLOAD_WORKERS pool instead of queueing on Django's
+    single thread-sensitive executor, which every sync view shares.
+    """
+    if request.method != 'POST':
+        return render(request, 'upload.html', {'form': UploadFileForm()})
+
+    form = await offload(_bound_upload_form, request)
+    if not form.is_valid():
+        return render(request, 'upload.html', {'form': form})
 
-def upload_file(request):
-    if request.method == 'POST' and request.FILES.get('file'):
-        file = request.FILES['file']
+    try:
+        batch, uploads, repeats = await offload(ingest_uploads, form.cleaned_data['files'])
+    except UnreadableUpload as exc:
+        form.add_error('files', str(exc))
+        return render(request, 'upload.html', {'form': form})
+    # Rows are fetched page by page from upload_preview
+    return render(request, 'upload.html', {
+        'form': UploadFileForm(),
+        'batch': batch,
+        'uploads': uploads,
+        'repeat_count': len(repeats),
+        'repeats': list(repeats.items())[:REPEAT_EXAMPLES],
+        'page_size': PREVIEW_PAGE_SIZE,
+        'success_msg': f'{len(uploads)} file(s) uploaded successfully!',
+    })
 
-        ext = os.path.splitext(file.name)[1].lower()
-        if ext == '.csv':
-            df = pd.read_csv(file)
-        else:
-            df = pd.read_excel(file, engine='openpyxl')
+def _bound_upload_form(request):
+    # Parsing the multipart body writes large files out to disk
+    form = UploadFileForm(request.POST, request.FILES)
+    form.is_valid()
+    return form
 
-        upload_path = os.path.join(settings.MEDIA_ROOT, 'uploads')
-        os.makedirs(upload_path, exist_ok=True)
+def ingest_uploads(files):
+    """
+    Store and index uploaded files as a new batch. Returns (batch, uploads,
+    repeats), repeats being {AWB: earlier batch ids} for the uploaded AWBs
+    that were already scanned as returns.
+    """
+    saved = [save_upload(file) for file in files]
+    uploads = list(dict.fromkeys(upload for upload, _ in saved))
+    # Content seen before is already indexed, unless indexing it failed
+    build_upload_indexes(list(dict.fromkeys(upload for upload, indexed in saved if not indexed)))
+    batch = ReturnBatch.objects.create(name=', '.join(file.name for file in files))
+    batch.uploads.add(*uploads)
+    classify_batch(batch)
+    awbs = batch.rows.values_list('awb_number', flat=True).distinct()
+    return batch, uploads, repeat_batches(batch, awbs.iterator(chunk_size=CLASSIFY_CHUNK))
 
-        unique_name = f"{uuid.uuid4()}_{file.name}"
-        file_path = os.path.join(upload_path, unique_name)
+def upload_preview(request, upload_id):
+    upload = get_object_or_404(UploadedFile, pk=upload_id)
+    try:
+        offset = max(int(request.GET.get('offset', 0)), 0)
+        limit = min(max(int(request.GET.get('limit', PREVIEW_PAGE_SIZE)), 1), PREVIEW_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'offset and limit must be integers'}, status=400)
 
-        with open(file_path, 'wb+') as dest:
-            for chunk in file.chunks():
-                dest.write(chunk)
+    columns, rows = _preview_page(upload.file.path, offset, limit)
+    return JsonResponse({
+        'columns': columns,
+        'rows': rows,
+        'offset': offset,
+        'limit': limit,
+        'total': upload.row_count,
+    })
 
-        # Show preview
-        return render(request, 'upload.html', {
-            'data': df.to_dict(orient="records"),
-            'columns': df.columns,
-            'success_msg': 'File uploaded successfully!',
-            'uploaded_file': file_path
-        })
+def _preview_page(path, offset, limit):
+    # Small CSVs are read like they are indexed, without loading pandas
+    if is_csv(path) and os.path.getsize(path) <= SMALL_CSV_BYTES:
+        columns = sniff_csv(path).columns
+        rows = itertools.islice(iter_csv_rows(path, columns), offset, offset + limit)
+        return columns, [values for _, values in rows]
 
-    return render(request, 'upload.html')
+    df = read_upload(path, nrows=limit, offset=offset).astype(object)
+    df = df.where(df.notna(), None)
+    return list(df.columns), df.values.tolist()
 
-def scan_awb(request):
-    return render(request, 'scan.html')
+def scan_awb(request, batch_id):
+    batch = get_object_or_404(ReturnBatch, pk=batch_id)
+    return render(request, 'scan.html', {'batch': batch})
 
-def save_scan(request):
+async def save_scan(request, batch_id):
+    batch = await aget_object_or_404(ReturnBatch, pk=batch_id)
     if request.method == 'POST':
-        scanned_data = request.POST.get('scanned_data', '')
-        new_awbs = set(a.strip() for a in scanned_data.replace('\n', ',').split(',') if a.strip())
+        await offload(_save_scans, request, batch)
+        return redirect('compare', batch_id=batch.id)
 
-        txt_path = os.path.join(settings.MEDIA_ROOT, 'scanned_awbs.txt')
-        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+    return HttpResponse("Invalid Request", status=400)
 
-        if os.path.exists(txt_path):
-            with open(txt_path, 'r') as f:
-                existing = {line.strip() for line in f if line.strip()}
-        else:
-            existing = set()
+def _save_scans(request, batch):
+    record_scans(batch, parse_scanned_data(request.POST.get('scanned_data', '')))
 
-        combined = existing.union(new_awbs)
+@require_POST
+async def scan_ingest(request, batch_id):
+    """
+    Accept one scan or a micro-batch as JSON ({"awb": ...} or {"awbs": [...]})
+    and report straight back whether each AWB is in the batch's uploads. The
+    body may be gzipped (Content-Encoding: gzip). A micro-batch sent with an
+    Idempotency-Key is applied once; retries get the first answer back.
+    """
+    batch = await aget_object_or_404(ReturnBatch, pk=batch_id)
+    try:
+        payload = json.loads(_request_body(request) or b'{}')
+    except (ValueError, zlib.error):
+        return JsonResponse({'error': 'Body must be JSON, optionally gzipped'}, status=400)
 
-        with open(txt_path, 'w') as f:
-            for aw in combined:
-                f.write(f"{aw}\n")
+    raw = payload.get('awbs', [payload.get('awb')]) if isinstance(payload, dict) else None
+    if not isinstance(raw, list):
+        return JsonResponse({'error': 'Send "awb" or a list of "awbs"'}, status=400)
+    awbs = [str(a).strip() for a in raw if a is not None and str(a).strip()]
+    key = request.headers.get('Idempotency-Key', '')[:64]
+    return JsonResponse(await offload(scan_feedback, batch, awbs, key))
 
-        return redirect('compare')
+def _request_body(request):
+    if request.headers.get('Content-Encoding', '').lower() != 'gzip':
+        if len(request.body) > SCAN_BODY_MAX_BYTES:
+            raise ValueError("Body too large")
+        return request.body
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    body = inflater.decompress(request.body, SCAN_BODY_MAX_BYTES)
+    if inflater.unconsumed_tail:
+        raise ValueError("Body too large")
+    return body
 
-    return HttpResponse("Invalid Request", status=400)
+def scan_feedback(batch, awbs, key=''):
+    """Record scans and describe each one, with near matches if enabled."""
+    if key:
+        sync = batch.syncs.filter(key=key).first()
+        if sync is not None:
+            return sync.response
 
-def extract_awb_from_url(url):
-    if not isinstance(url, str):
-        return ''
-    patterns = [
-        r'trackingId=([A-Z0-9]+)',
-        r'refNum=([A-Z0-9]+)',
-        r'trackid=([0-9]+)',
-        r'/([A-Z0-9]{10,})$',
-        r'/package/([0-9]+)',
-    ]
-    for pattern in patterns:
-        m = re.search(pattern, str(url))
-        if m:
-            return m.group(1)
-    return url.strip()
-
-def get_latest_uploaded_file():
-    upload_folder = os.path.join(settings.MEDIA_ROOT, 'uploads')
-    if not os.path.exists(upload_folder):
-        return None
-    files = [os.path.join(upload_folder, f) for f in os.listdir(upload_folder)
-             if os.path.isfile(os.path.join(upload_folder, f))]
-    if not files: 
-        return None
-    return max(files, key=os.path.getctime)
-
-def compare_data(request):
-    latest = get_latest_uploaded_file()
-    if not latest:
-        return HttpResponse("No uploaded file found.")
+    results = scan_results(batch, awbs)
+    if settings.AWB_NEAR_MATCH:
+        suggestions = suggest_matches(batch, [r['awb'] for r in results if not r['matched']])
+        for result in results:
+            result['suggestions'] = suggestions.get(result['awb'], [])
 
-    ext = os.path.splitext(latest)[1].lower()
-    if ext == '.csv':
-        df = pd.read_csv(latest)
-    else:
-        df = pd.read_excel(latest, engine='openpyxl')
+    response = {
+        'results': results,
+        'matched_count': classify_batch(batch).matched_count,
+    }
+    if key:
+        # A concurrent retry may have stored its answer first; both return that one
+        response = ScanSync.objects.get_or_create(batch=batch, key=key, defaults={'response': response})[0].response
+    return response
 
-    df = df.applymap(lambda x: str(x).strip())
+def compare_data(request, batch_id):
+    batch = get_object_or_404(ReturnBatch, pk=batch_id)
+    if not batch.uploads.exists():
+        return HttpResponse("No uploaded file found.")
 
-    scanned_file = os.path.join(settings.MEDIA_ROOT, 'scanned_awbs.txt')
-    if not os.path.exists(scanned_file):
+    if not has_scans(batch):
         return HttpResponse("No scanned AWB data found.")
 
-    with open(scanned_file, 'r') as f:
-        scanned_set = {line.strip() for line in f if line.strip()}
-
-    if 'Tracking Link' in df.columns:
-        df['__awb__'] = df['Tracking Link'].apply(extract_awb_from_url)
-    elif 'AWB Number' in df.columns:
-        df['__awb__'] = df['AWB Number'].astype(str).str.strip()
-    else:
+    if not batch.has_awb_column:
         return HttpResponse("AWB column not found.")
 
-    df['Matched'] = df['__awb__'].isin(scanned_set)
-
-    matched = df[df['Matched']].drop(columns=['Matched'])
-    unmatched = df[~df['Matched']].drop(columns=['Matched'])
+    # Only scans and uploads added since the last compare are classified
+    classify_batch(batch)
 
-    # save into media folder
-    matched_path = os.path.join(settings.MEDIA_ROOT, 'matched.xlsx')
-    unmatched_path = os.path.join(settings.MEDIA_ROOT, 'unmatched.xlsx')
-    matched.to_excel(matched_path, index=False)
-    unmatched.to_excel(unmatched_path, index=False)
+    suggestions = None
+    if settings.AWB_NEAR_MATCH:
+        unmatched = batch.scans.filter(matched=False).values_list('awb_number', flat=True)
+        suggestions = list(suggest_matches(batch, unmatched).items())[:SUGGESTION_LIMIT]
 
+    # Workbooks are built in the background; the page polls job_status
     return render(request, 'result.html', {
-        'matched_count': len(matched),
-        'unmatched_count': len(unmatched),
-        'matched_path': matched_path,
-        'unmatched_path': unmatched_path,
+        'batch': batch,
+        'job': enqueue_report_job(batch),
+        'matched_count': batch.matched_count,
+        'unmatched_count': batch.unmatched_count,
+        'suggestions': suggestions,
+        'suggestion_limit': SUGGESTION_LIMIT,
     })
 
-def download_matched(request):
-    path = os.path.join(settings.MEDIA_ROOT, 'matched.xlsx')
-    with open(path, 'rb') as f:
-        response = HttpResponse(f.read(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename=matched.xlsx'
-        return response
+async def pod_upload(request, batch_id):
+    """
+    Bulk proof-of-delivery check. GET shows the form and the results so
+    far; POST takes a ZIP of POD PDFs and streams NDJSON progress while the
+    PDFs are read in a process pool and matched against the batch.
+    """
+    batch = await aget_object_or_404(ReturnBatch, pk=batch_id)
+    if request.method != 'POST':
+        return render(request, 'pods.html', await offload(_pod_context, batch, PodZipForm()))
+
+    form = await offload(_bound_pod_form, request)
+    if not form.is_valid():
+        return render(request, 'pods.html', await offload(_pod_context, batch, form), status=400)
+
+    path = await offload(store_pod_zip, form.cleaned_data['archive'])
+    lines = check_pods(batch, path)
+    response = StreamingHttpResponse(aiterate(lines) if isinstance(request, ASGIRequest) else lines,
+                                     content_type='application/x-ndjson')
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-def download_unmatched(request):
-    path = os.path.join(settings.MEDIA_ROOT, 'unmatched.xlsx')
-    with open(path, 'rb') as f:
-        response = HttpResponse(f.read(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename=unmatched.xlsx'
+def _bound_pod_form(request):
+    form = PodZipForm(request.POST, request.FILES)
+    form.is_valid()
+    return form
+
+def _pod_context(batch, form):
+    pods = batch.pods.all()
+    return {
+        'batch': batch,
+        'form': form,
+        'checked': pods.count(),
+        'matched': pods.filter(matched=True).count(),
+        'unmatched': list(pods.filter(matched=False)[:POD_LIST_LIMIT]),
+        'limit': POD_LIST_LIMIT,
+    }
+
+def job_status(request, job_id):
+    fail_stale_jobs(ReportJob.objects.filter(pk=job_id))
+    job = get_object_or_404(ReportJob, pk=job_id)
+    return JsonResponse({
+        'id': job.pk,
+        'batch': job.batch_id,
+        'status': job.status,
+        'matched_count': job.matched_count,
+        'unmatched_count': job.unmatched_count,
+        'error': job.error,
+    })
+
+async def download_report(request, batch_id, matched):
+    """
+    Stream a report. Over ASGI the body is produced off the event loop,
+    since Django would otherwise read a blocking iterator into memory first.
+    """
+    batch = await aget_object_or_404(ReturnBatch, pk=batch_id)
+    if not await offload(_classify_for_report, batch):
+        return HttpResponse("Nothing to compare yet.", status=404)
+
+    name = 'matched' if matched else 'unmatched'
+    asgi = isinstance(request, ASGIRequest)
+    if request.GET.get('format') == 'csv':
+        lines = joined(stream_csv(batch, matched), CSV_STREAM_LINES)
+        response = StreamingHttpResponse(aiterate(lines) if asgi else lines, content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename={name}.csv'
         return response
+
+    path = await offload(cached_report, batch, matched)
+    if not asgi:
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{name}.xlsx', content_type=XLSX_TYPE)
+    response = StreamingHttpResponse(aiterate(file_chunks(path)), content_type=XLSX_TYPE)
+    response['Content-Length'] = os.path.getsize(path)
+    response['Content-Disposition'] = f'attachment; filename={name}.xlsx'
+    return response
+
+def _classify_for_report(batch):
+    if not batch.has_awb_column or not has_scans(batch):
+        return False
+    classify_batch(batch)
+    return True
+
+def analytics(request):
+    """
+    Parcels, matched and unmatched per SKU, courier, return type, reason or
+    delivery day, read off the rollups classify_batch keeps; ?batch=<id>
+    narrows to one batch and ?format=json returns the table as JSON.
+    """
+    by = request.GET.get('by', 'sku')
+    if by not in ANALYTICS_GROUPS:
+        return JsonResponse({'error': f'by must be one of {", ".join(ANALYTICS_GROUPS)}'}, status=400)
+
+    rollups = ReturnRollup.objects.all()
+    batch = None
+    if request.GET.get('batch'):
+        try:
+            batch_id = int(request.GET['batch'])
+        except ValueError:
+            return JsonResponse({'error': 'batch must be an integer'}, status=400)
+        batch = get_object_or_404(ReturnBatch, pk=batch_id)
+        classify_batch(batch)
+        rollups = rollups.filter(batch=batch)
+
+    field = ANALYTICS_GROUPS[by][0]
+    groups = list(rollups.values(field).annotate(parcels=Sum('parcels'), matched=Sum('matched'))
+                  .annotate(unmatched=F('parcels') - F('matched'))
+                  .order_by('-unmatched', '-parcels', field)[:ANALYTICS_LIMIT])
+    for group in groups:
+        group['value'] = group.pop(field)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'by': by, 'batch': batch and batch.pk, 'groups': groups})
+    return render(request, 'analytics.html', {
+        'batch': batch,
+        'by': by,
+        'label': ANALYTICS_GROUPS[by][1],
+        'groups': ANALYTICS_GROUPS,
+        'rows': groups,
+        'limit': ANALYTICS_LIMIT,
+    })
+
+def metrics_view(request):
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+async def download_matched(request, batch_id):
+    return await download_report(request, batch_id, matched=True)
+
+async def download_unmatched(request, batch_id):
+    return await download_report(request, batch_id, matched=False)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Load test a running server with concurrent warehouse traffic, to compare
+serving modes on the same machine:
+
+    # WSGI, the synchronous setup: every request holds a worker until it ends
+    gunicorn return_mgm.wsgi --workers 4
+    python load_test.py http://127.0.0.1:8000 --output wsgi.json
+
+    # ASGI: the same workers, each on an event loop with OFFLOAD_WORKERS threads
+    uvicorn return_mgm.asgi:application --workers 4
+    python load_test.py http://127.0.0.1:8000 --output asgi.json --baseline wsgi.json
+
+Each concurrency level runs --requests requests of the chosen scenario:
+scan posts to the JSON scan endpoint, CSV downloads, uploads of a small
+export, or a mix. --upload-kbps sends upload bodies at a phone-on-Wi-Fi pace,
+which is what pins WSGI workers. The script is only an HTTP client; it
+creates its own batch on the server, so point it at a throwaway database.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from synthetic_exports import scan_set, write_export
+
+BOUNDARY = 'loadtest-boundary'
+SCAN_POST_SIZE = 20
+# scenario -> {request kind: weight}
+SCENARIOS = {
+    'scan': {'scan': 1},
+    'download': {'download': 1},
+    'upload': {'upload': 1},
+    'mixed': {'scan': 8, 'download': 1, 'upload': 1},
+}
+
+_local = threading.local()
+
+def connection(url):
+    if getattr(_local, 'conn', None) is None:
+        parts = urlsplit(url)
+        conn_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        _local.conn = conn_class(parts.hostname, parts.port, timeout=300)
+    return _local.conn
+
+def send(url, method, path, body=b'', headers=(), kbps=None):
+    """One request on this thread's keep-alive connection; returns (status, body)."""
+    conn = connection(url)
+    try:
+        conn.putrequest(method, path)
+        for name, value in headers:
+            conn.putheader(name, value)
+        conn.putheader('Content-Length', str(len(body)))
+        conn.endheaders()
+        # A tenth of a second's worth of bytes at a time
+        step = max(int(kbps * 1024 / 10), 1) if kbps else max(len(body), 1)
+        for i in range(0, len(body), step):
+            conn.send(body[i:i + step])
+            if kbps:
+                time.sleep(0.1)
+        response = conn.getresponse()
+        return response.status, response.read()
+    except (OSError, http.client.HTTPException):
+        conn.close()
+        _local.conn = None
+        raise
+
+def multipart(name, filename, data):
+    head = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            'Content-Type: text/csv\r\n\r\n').encode()
+    return head + data + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+def upload(url, data, kbps=None):
+    status, body = send(url, 'POST', '/upload/', multipart('files', 'loadtest.csv', data),
+                        [('Content-Type', f'multipart/form-data; boundary={BOUNDARY}')], kbps)
+    batch = re.search(rb'/batch/(\d+)/scan/', body)
+    return status, batch and int(batch.group(1))
+
+class Workload:
+    def __init__(self, url, rows, upload_rows, kbps):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, 'export.csv')
+            self.awbs = write_export(path, rows)
+            with open(path, 'rb') as f:
+                status, self.batch = upload(url, f.read())
+            if self.batch is None:
+                raise RuntimeError(f"Setup upload failed with HTTP {status}")
+            write_export(path, upload_rows, seed=1)
+            with open(path, 'rb') as f:
+                self.upload_data = f.read()
+        self.url = url
+        self.kbps = kbps
+        self.scans = scan_set(self.awbs, 1.0)
+
+    def request(self, kind, rng):
+        if kind == 'scan':
+            awbs = rng.sample(self.scans, min(SCAN_POST_SIZE, len(self.scans)))
+            return send(self.url, 'POST', f'/api/batch/{self.batch}/scans/', json.dumps({'awbs': awbs}).encode(),
+                        [('Content-Type', 'application/json')])[0]
+        if kind == 'download':
+            return send(self.url, 'GET', f'/batch/{self.batch}/download-unmatched/?format=csv')[0]
+        return upload(self.url, self.upload_data, self.kbps)[0]
+
+def run_level(workload, scenario, concurrency, requests, seed=46232):
+    kinds, weights = zip(*SCENARIOS[scenario].items())
+    rng = random.Random(seed)
+    plan = rng.choices(kinds, weights, k=requests)
+    latencies = {kind: [] for kind in kinds}
+    errors = 0
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            status = workload.request(plan[i], random.Random(seed + i))
+        except (OSError, http.client.HTTPException):
+            status = None
+        return plan[i], status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for kind, status, seconds in pool.map(one, range(requests)):
+            if status is None or status >= 400:
+                errors += 1
+            else:
+                latencies[kind].append(seconds)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round((requests - errors) / elapsed, 2),
+        'errors': errors,
+        'latency': {kind: percentiles(values) for kind, values in latencies.items() if values},
+    }
+
+def percentiles(values):
+    values = sorted(values)
+    pick = lambda q: round(values[min(int(q * len(values)), len(values) - 1)] * 1000, 1)
+    return {'p50_ms': pick(0.5), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99),
+            'mean_ms': round(statistics.fmean(values) * 1000, 1)}
+
+def print_results(results, baseline=None):
+    previous = (baseline or {}).get('levels', {})
+    for level, result in results['levels'].items():
+        line = (f"   {int(level):>4} clients {result['requests_per_second']:9.2f} req/s"
+                f" {result['errors']:5d} errors")
+        before = previous.get(level, {}).get('requests_per_second')
+        if before:
+            line += f"   {result['requests_per_second'] / before:6.2f}x throughput"
+        print(line)
+        for kind, stats in result['latency'].items():
+            print(f"        {kind:<9} p50 {stats['p50_ms']:9.1f} ms   p95 {stats['p95_ms']:9.1f} ms"
+                  f"   p99 {stats['p99_ms']:9.1f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('url', help="Base URL of the server, e.g. http://127.0.0.1:8000")
+    parser.add_argument('--scenario', choices=SCENARIOS, default='mixed')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument('--rows', type=int, default=10_000, help="Rows of the export scans are checked against")
+    parser.add_argument('--upload-rows', type=int, default=1_000)
+    parser.add_argument('--upload-kbps', type=float, help="Throttle upload bodies to this many KB/s")
+    parser.add_argument('--output', default='load_test.json')
+    parser.add_argument('--baseline')
+    args = parser.parse_args()
+
+    print(f"🧪 Preparing a {args.rows:,} row batch on {args.url}...")
+    workload = Workload(args.url, args.rows, args.upload_rows, args.upload_kbps)
+    results = {
+        'url': args.url,
+        'scenario': args.scenario,
+        'requests': args.requests,
+        'upload_kbps': args.upload_kbps,
+        'levels': {},
+    }
+    for concurrency in args.concurrency:
+        print(f"🚚 {args.requests} {args.scenario} requests from {concurrency} clients...")
+        results['levels'][str(concurrency)] = run_level(workload, args.scenario, concurrency, args.requests)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Results written to {args.output}")
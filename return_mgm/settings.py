@@ -10,12 +10,16 @@ DEBUG = True
 ALLOWED_HOSTS = ['*']
 
 INSTALLED_APPS = [
+    'django.contrib.sessions',
     'django.contrib.staticfiles',
     'core',
+    'auth_google',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
 ]
 
@@ -37,8 +41,16 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'return_mgm.wsgi.application'
 
-# No database
-DATABASES = {}
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Scanner stations write concurrently; wait for the lock instead of failing.
+        # IMMEDIATE takes it when a transaction starts, so a transaction that
+        # reads before it writes cannot deadlock against another writer.
+        'OPTIONS': {'timeout': 20, 'transaction_mode': 'IMMEDIATE'},
+    }
+}
 
 STATIC_URL = '/static/'
 
@@ -47,3 +59,68 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+
+# Google endpoints; point them at a local stub server to test auth_google offline
+GOOGLE_AUTH_URI = os.getenv('GOOGLE_AUTH_URI', 'https://accounts.google.com/o/oauth2/auth')
+GOOGLE_TOKEN_URI = os.getenv('GOOGLE_TOKEN_URI', 'https://oauth2.googleapis.com/token')
+GOOGLE_API_BASE_URL = os.getenv('GOOGLE_API_BASE_URL', 'https://www.googleapis.com')
+GOOGLE_HTTP_TIMEOUT = float(os.getenv('GOOGLE_HTTP_TIMEOUT', 10))
+GOOGLE_HTTP_RETRIES = int(os.getenv('GOOGLE_HTTP_RETRIES', 3))
+# How long a user's Drive listing is served from cache; ?refresh=1 skips it
+GOOGLE_DRIVE_CACHE_SECONDS = int(os.getenv('GOOGLE_DRIVE_CACHE_SECONDS', 60))
+
+# Requests slower than this are logged as warnings with their stage timings
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 2))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '{asctime} {levelname} {name}: {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'root': {'handlers': ['console'], 'level': 'WARNING'},
+    'loggers': {
+        'core': {'handlers': ['console'], 'level': os.getenv('CORE_LOG_LEVEL', 'INFO'), 'propagate': False},
+    },
+}
+
+# `manage.py prune_uploads` deletes uploads no batch uses that have been unused
+# for this many days, along with stray files under media/uploads; 0 keeps them.
+# Every upload joins the batch it came in with, so only uploads that failed to
+# index or whose batches are gone qualify: with BATCH_RETENTION_DAYS at 0,
+# indexed uploads and their files are kept for good
+UPLOAD_RETENTION_DAYS = int(os.getenv('UPLOAD_RETENTION_DAYS', 30))
+
+# It also deletes batches idle for this many days, with their scans, rollups
+# and POD checks, when set; 0 (the default) keeps every batch
+BATCH_RETENTION_DAYS = int(os.getenv('BATCH_RETENTION_DAYS', 0))
+
+# And the stored answers to scanner micro-batches older than this many days;
+# a retry only ever comes within minutes, or after the scanner page reloads
+SCAN_SYNC_RETENTION_DAYS = int(os.getenv('SCAN_SYNC_RETENTION_DAYS', 7))
+
+# Also suggest uploaded AWBs one typo away from unmatched scans
+AWB_NEAR_MATCH = os.getenv('AWB_NEAR_MATCH', 'false').lower() == 'true'
+
+# Processes parsing the files of a large multi-file upload side by side
+UPLOAD_PARSE_WORKERS = int(os.getenv('UPLOAD_PARSE_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Threads building reports in the background; 0 builds them inside the request
+REPORT_JOB_WORKERS = int(os.getenv('REPORT_JOB_WORKERS', 2))
+
+# A job queued or running for longer lost its worker (a restart, a frozen
+# serverless instance) and is failed, so the next compare starts a new one
+REPORT_JOB_TIMEOUT_MINUTES = int(os.getenv('REPORT_JOB_TIMEOUT_MINUTES', 30))
+
+# Processes reading the PDFs of a bulk proof-of-delivery upload
+POD_WORKERS = int(os.getenv('POD_WORKERS', os.cpu_count() or 1))
+
+# Threads the async views hand blocking work (files, pandas, the ORM) to
+OFFLOAD_WORKERS = int(os.getenv('OFFLOAD_WORKERS', min(32, (os.cpu_count() or 1) + 4)))
+
+# Scans read from the database on top of the AWB history store before they
+# are merged into it
+AWB_HISTORY_MERGE_SCANS = int(os.getenv('AWB_HISTORY_MERGE_SCANS', 10_000))
@@ -0,0 +1,66 @@
+"""
+Synthetic Meesho supplier panel exports and scan sets for the benchmarks.
+Standard library only, so that load_test.py, a plain HTTP client, can
+build its uploads without Django or pandas.
+"""
+import csv
+import random
+
+PREAMBLE = [
+    ['Meesho Supplier Panel'],
+    ['Supplier ID', '46232'],
+    ['Supplier Registered Name', 'BENCHMARK SUPPLIER'],
+    ['Supplier Email ID', 'bench@example.com'],
+    ['Download Date & Time Stamp', '1.75E+12'],
+    [],
+]
+COLUMNS = ['S No', 'Product Name', 'SKU', 'Variation', 'Meesho PID', 'Category', 'Qty',
+           'Order Number', 'Suborder Number', 'Dispatch Date', 'Return Created Date',
+           'Type of Return', 'Sub Type', 'Delivered Date', 'Courier Partner', 'AWB Number',
+           'Tracking Link', 'Proof of Delivery', 'Return Price Type', 'Return Reason',
+           'Detailed Return Reason', 'OTP verified at']
+
+# (courier, AWB format, tracking link format) as seen in real exports
+COURIERS = [
+    ('Shadowfax', 'R{n:010d}FPL', 'https://track.shadowfax.in/track?order=return&trackingId={awb}'),
+    ('Valmo', 'M{n:011d}', 'https://meesho.portal.shipsy.io/track/result?refNum={awb}&searchBy=referenceNumber'),
+    ('Xpress Bees', '134{n:012d}', 'https://www.xpressbees.com/track?isawb=Yes&trackid={awb}'),
+    ('Delhivery', '149{n:013d}', 'https://www.delhivery.com/track/package/{awb}'),
+    ('PocketShip', 'VL{n:013d}', 'https://www.valmo.in/track/{awb}'),
+]
+RETURN_TYPES = [('Customer Return', 'FIRST_RET'), ('Courier Return (RTO)', 'RTO')]
+REASONS = [('Have size / fit related issues', 'Size correct but too tight'),
+           ('Received a different product', 'Different colour'),
+           ('Product is damaged', 'Torn or stained'),
+           ('Did not like the product', 'Quality not as expected')]
+SKUS = [f'SKU-{i:04d}' for i in range(200)]
+
+def write_export(path, rows, seed=46232):
+    """Write a Meesho-format export of `rows` returns and return their AWBs."""
+    rng = random.Random(seed)
+    awbs = []
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        for line in PREAMBLE:
+            writer.writerow(line + [''] * (len(COLUMNS) - len(line)))
+        writer.writerow(COLUMNS)
+        for i in range(rows):
+            courier, awb_format, link_format = rng.choice(COURIERS)
+            awb = awb_format.format(n=rng.randrange(10 ** 9, 10 ** 10))
+            return_type, sub_type = rng.choice(RETURN_TYPES)
+            reason, detail = rng.choice(REASONS)
+            order = rng.randrange(10 ** 17, 2 * 10 ** 17)
+            awbs.append(awb)
+            writer.writerow([
+                i + 1, 'Synthetic Kurta Set', rng.choice(SKUS), rng.choice(['S', 'M', 'L', 'XL']),
+                rng.randrange(10 ** 8), 'Kurtis', 1, order, f'{order}_1', '07-07-25', '16-07-25',
+                return_type, sub_type, '21-07-25', courier, awb, link_format.format(awb=awb),
+                f'https://example.com/pod/{i}.pdf', 'Meesho Price', reason, detail, '21-07-25 9:38',
+            ])
+    return awbs
+
+def scan_set(awbs, ratio, seed=46232):
+    """Scans covering `ratio` of the export plus a tenth as many unknown AWBs."""
+    rng = random.Random(seed)
+    scans = rng.sample(awbs, int(len(awbs) * ratio))
+    return scans + [f'X{rng.randrange(10 ** 12)}' for _ in range(len(scans) // 10)]
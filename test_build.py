@@ -3,6 +3,8 @@
 Test script to verify the build process works correctly
 """
 import os
+import re
+import subprocess
 import sys
 import django
 from pathlib import Path
@@ -17,6 +19,11 @@ django.setup()
 
 from django.core.management import execute_from_command_line
 
+# Cold start budget for importing the Vercel entry point, and the libraries
+# that must only load once a view needs them
+IMPORT_BUDGET_MS = int(os.getenv('IMPORT_BUDGET_MS', 500))
+LAZY_MODULES = ['pandas', 'numpy', 'openpyxl', 'google_auth_oauthlib', 'requests', 'dotenv']
+
 def test_static_collection():
     """Test static file collection"""
     print("🧪 Testing static file collection...")
@@ -53,12 +60,44 @@ def test_migrations():
         print(f"❌ Migration failed: {e}")
         return False
 
+def test_import_time():
+    """Test the cold start import time with python -X importtime"""
+    print("\n🧪 Testing cold start import time...")
+    # The first request loads the URLconf and with it every view module, so
+    # the cold start includes them, not just the WSGI application
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app, return_mgm.urls'],
+                            cwd=project_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"❌ Importing app failed:\n{result.stderr}")
+        return False
+
+    total_us, imported = 0, set()
+    for line in result.stderr.splitlines():
+        m = re.match(r'import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)', line)
+        if m:
+            imported.add(m.group(3).split('.')[0])
+            if not m.group(2):  # top-level imports; their cumulative times add up to the total
+                total_us += int(m.group(1))
+
+    eager = [name for name in LAZY_MODULES if name in imported]
+    total_ms = total_us / 1000
+    print(f"⏱️  Imports took {total_ms:.0f} ms (budget {IMPORT_BUDGET_MS} ms)")
+    if eager:
+        print(f"❌ Imported at startup: {', '.join(eager)}")
+        return False
+    if total_ms > IMPORT_BUDGET_MS:
+        print("❌ Import time is over budget")
+        return False
+    print("✅ Cold start is within budget")
+    return True
+
 if __name__ == '__main__':
     print("🚀 Starting build test...")
     
     success = True
     success &= test_static_collection()
     success &= test_migrations()
+    success &= test_import_time()
     
     if success:
         print("\n🎉 All tests passed! Build should work on Vercel.")